@@ -0,0 +1,214 @@
+"""
+Offline benchmarks for nredarwin, run against the fixtures in testdata.
+
+Responses are served in-process by ReplayTransport, so results measure the library rather than the network.
+Boards and calling point lists are repeated to produce fixtures of several sizes. For each size the benchmark
+reports the time to parse a response, the time to build and fully materialize the model, whole-session
+requests per second, and the memory retained by each model. Each fixture is run through both the lite engine
+and the default suds engine, which reads the WSDL bundled with the package.
+
+    python benchmark.py
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --tolerance 0.25
+
+With --compare the script exits with status 1 if any timing is slower than the baseline by more than the
+tolerance, so it can gate a release.
+
+Retained memory is measured with tracemalloc, which needs Python 3.4 or later. On older versions it is
+reported as n/a and timings use time.time.
+"""
+import argparse
+import gc
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
+
+from suds.client import Client
+
+from nredarwin.replay import ReplayTransport
+from nredarwin.webservice import (BUNDLED_WSDL, DarwinLdbSession, LiteSoapEngine, ServiceDetails, StationBoard,
+    parse_soap_response)
+
+TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata')
+
+#time.perf_counter is not available before Python 3.3
+perf_counter = getattr(time, 'perf_counter', time.time)
+
+#metrics where a larger value is worse, compared against a baseline
+TIMINGS = ('parse_ms', 'build_ms')
+
+#suds is over ten times slower than the lite engine, so its runs are timed over fewer calls
+SUDS_ITERATIONS_DIVISOR = 10
+
+def read_fixture(filename):
+    with open(os.path.join(TESTDATA, filename), 'rb') as fh:
+        return fh.read()
+
+def repeat_children(data, container, child, factor):
+    """
+    Repeat the child elements of every container element in a fixture factor times, giving repeated services
+    distinct service ids
+    """
+    pattern = re.compile(br'(<' + container + br'\b[^>]*>)(.*?)(</' + container + br'>)', re.S)
+    child_re = re.compile(br'<' + child + br'\b.*?</' + child + br'>', re.S)
+    def repeat(match):
+        children = b''.join(child_re.findall(match.group(2)))
+        copies = [children]
+        for copy in range(1, factor):
+            copies.append(re.sub(br'(<(?:\w+:)?serviceID[^>]*>)([^<]*)', lambda m: m.group(1) + m.group(2) +
+                ('-%d' % copy).encode('ascii'), children))
+        return match.group(1) + b''.join(copies) + match.group(3)
+    return pattern.sub(repeat, data)
+
+def board_fixture(factor):
+    return repeat_children(read_fixture('departure-board.xml'), b'trainServices', b'service', factor)
+
+def details_fixture(factor):
+    return repeat_children(read_fixture('service-details.xml'), b'callingPointList', b'callingPoint', factor)
+
+def materialize(model):
+    if isinstance(model, StationBoard):
+        for service in model.train_services:
+            service.destinations
+        model.inflate_times()
+    else:
+        model.previous_calling_points
+        model.subsequent_calling_points
+        model.inflate_times()
+    return model
+
+def time_per_call(func, iterations):
+    func()
+    start = perf_counter()
+    for _ in range(iterations):
+        func()
+    return (perf_counter() - start) / iterations
+
+def retained_bytes(func, count=20):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = [func() for _ in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return (after - before) / float(count)
+
+def lite_session(operation, data):
+    return DarwinLdbSession(api_key='BENCHMARK', engine=LiteSoapEngine(
+        'BENCHMARK', transport=ReplayTransport(responses={operation: data})))
+
+def suds_session(operation, data, cache_dir):
+    return DarwinLdbSession(api_key='BENCHMARK', wsdl=BUNDLED_WSDL, wsdl_cache_dir=cache_dir,
+        http_pool=ReplayTransport(responses={operation: data}))
+
+def suds_parser(operation):
+    """
+    Return a function parsing a response to operation with suds, as the suds engine does
+    """
+    method = Client('file:' + pathname2url(BUNDLED_WSDL), nosend=True, cache=None).service['LDBServiceSoap'][operation]
+    return lambda data: method(__inject={'msg': data, 'reply': data}).process_reply(data)
+
+def bench(name, model_class, data, operation, call, iterations, session, parse=parse_soap_response):
+    soap = parse(data)
+    calls = max(1, iterations // 2)
+    per_request = time_per_call(lambda: materialize(call(session)), calls)
+    return {
+        'name': name,
+        'bytes': len(data),
+        'parse_ms': time_per_call(lambda: parse(data), iterations) * 1000,
+        'build_ms': time_per_call(lambda: materialize(model_class(soap)), iterations) * 1000,
+        'requests_per_second': 1.0 / per_request,
+        'retained_kb': retained_kb(lambda: materialize(call(session))),
+    }
+
+def retained_kb(func):
+    retained = retained_bytes(func)
+    return None if retained is None else retained / 1024
+
+def run(sizes, iterations):
+    queries = [
+        ('StationBoard', StationBoard, board_fixture, 'GetDepartureBoard', lambda session: session.get_station_board('MAN')),
+        ('ServiceDetails', ServiceDetails, details_fixture, 'GetServiceDetails',
+            lambda session: session.get_service_details('benchmark')),
+    ]
+    cache_dir = tempfile.mkdtemp(prefix='nredarwin-benchmark-')
+    try:
+        results = []
+        for size in sizes:
+            for label, model_class, fixture, operation, call in queries:
+                data = fixture(size)
+                results.append(bench('%s x%d' % (label, size), model_class, data, operation, call, iterations,
+                    lite_session(operation, data)))
+                results.append(bench('%s x%d suds' % (label, size), model_class, data, operation, call,
+                    max(1, iterations // SUDS_ITERATIONS_DIVISOR), suds_session(operation, data, cache_dir),
+                    suds_parser(operation)))
+        return results
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def print_results(results):
+    print("%-27s %9s %10s %10s %10s %12s" % ('fixture', 'bytes', 'parse ms', 'build ms', 'req/s', 'retained KB'))
+    for r in results:
+        retained = 'n/a' if r['retained_kb'] is None else '%.1f' % r['retained_kb']
+        print("%-27s %9d %10.3f %10.3f %10.0f %12s" % (r['name'], r['bytes'], r['parse_ms'], r['build_ms'],
+            r['requests_per_second'], retained))
+
+def regressions(results, baseline, tolerance):
+    """
+    Return a description of each timing more than tolerance slower than in baseline
+    """
+    previous = dict((r['name'], r) for r in baseline)
+    found = []
+    for r in results:
+        old = previous.get(r['name'])
+        if old is None:
+            continue
+        for metric in TIMINGS:
+            if r[metric] > old[metric] * (1 + tolerance):
+                found.append("%s %s %.3f, was %.3f" % (r['name'], metric, r[metric], old[metric]))
+        if r['requests_per_second'] < old['requests_per_second'] / (1 + tolerance):
+            found.append("%s requests_per_second %.0f, was %.0f" % (r['name'], r['requests_per_second'],
+                old['requests_per_second']))
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark nredarwin parsing and model building offline")
+    parser.add_argument('--sizes', default='1,10,50', help="comma separated fixture size multipliers")
+    parser.add_argument('--iterations', type=int, default=200, help="calls timed per measurement")
+    parser.add_argument('--save', help="write results to this JSON file")
+    parser.add_argument('--compare', help="compare results with this JSON file saved by --save")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="fractional slowdown allowed by --compare")
+    args = parser.parse_args(argv)
+
+    results = run([int(size) for size in args.sizes.split(',')], args.iterations)
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            found = regressions(results, json.load(fh), args.tolerance)
+        for regression in found:
+            print("REGRESSION: %s" % regression)
+        return 1 if found else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
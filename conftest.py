@@ -0,0 +1,4 @@
+import sys
+
+#async def is a syntax error before Python 3.5
+collect_ignore = [] if sys.version_info >= (3, 5) else ['test_nredarwin_async.py']
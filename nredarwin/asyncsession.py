@@ -0,0 +1,157 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import weakref
+
+from nredarwin.webservice import DarwinLdbSession, WebServiceError
+
+log = logging.getLogger(__name__)
+
+#get_running_loop is new in Python 3.7, before which get_event_loop returns the running loop inside a coroutine
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+class AsyncDarwinLdbSession(object):
+    """
+    An asyncio wrapper around a connection to the Darwin LDB web service
+
+    Query methods are coroutines returning the same StationBoard and ServiceDetails objects as
+    DarwinLdbSession. The SOAP calls themselves are still blocking: each one runs on a pool of
+    max_concurrency worker threads, so no more than max_concurrency calls are ever in flight and each
+    of them holds a thread. Coroutines beyond that wait their turn without a thread of their own. The
+    session may be used from several event loops, but the slots are counted per loop while the worker
+    threads are shared: calls from different loops then queue for a thread, and that wait counts against
+    call_timeout. Give each loop its own session to keep the timeout to the call itself. Requires Python
+    3.5 or later.
+    """
+
+    def __init__(self, wsdl=None, api_key=None, timeout=5, max_concurrency=10, call_timeout=None, session=None, executor=None):
+        """
+        Constructor
+
+        Keyword arguments:
+        wsdl -- the URL of the Darwin LDB WSDL document, see DarwinLdbSession
+        api_key -- a valid API key for the Darwin LDB webservice, see DarwinLdbSession
+        timeout -- a timeout in seconds for calls to the LDB Webservice (default 5)
+        max_concurrency -- the maximum number of calls in flight at any one time from each event loop (default 10)
+        call_timeout -- a limit in seconds on each call once it has a free slot, not counting time spent waiting for one. Defaults to timeout
+        session -- an existing DarwinLdbSession to wrap instead of creating a new one
+        executor -- an existing concurrent.futures executor to run calls on instead of creating a new one
+        """
+        if session is None:
+            session = DarwinLdbSession(wsdl=wsdl, api_key=api_key, timeout=timeout)
+        self._session = session
+        self._max_concurrency = max_concurrency
+        self._call_timeout = timeout if call_timeout is None else call_timeout
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_concurrency)
+        #a semaphore for each event loop using this session, as a semaphore belongs to a single loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self):
+        """
+        The underlying synchronous DarwinLdbSession
+        """
+        return self._session
+
+    async def get_station_board(self, crs, rows=10, include_departures=True, include_arrivals=False, destination_crs=None, origin_crs=None):
+        """
+        Query the darwin webservice to obtain a board for a particular station and return a StationBoard instance
+
+        Takes the same arguments as DarwinLdbSession.get_station_board
+        """
+        return await self._call(self._session.get_station_board, crs, rows=rows, include_departures=include_departures,
+            include_arrivals=include_arrivals, destination_crs=destination_crs, origin_crs=origin_crs)
+
+    async def get_service_details(self, service_id):
+        """
+        Get the details of an individual service and return a ServiceDetails instance.
+
+        Positional arguments:
+        service_id: A Darwin LDB service id
+        """
+        return await self._call(self._session.get_service_details, service_id)
+
+    async def _call(self, fn, *args, **kwargs):
+        loop = _running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self._max_concurrency)
+        await semaphore.acquire()
+        future = loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+        #the slot is freed when the call finishes, not when its caller gives up, so calls never queue for a thread
+        future.add_done_callback(lambda f: semaphore.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self._call_timeout)
+        except asyncio.TimeoutError:
+            log.warning("Darwin LDB call timed out after %s seconds", self._call_timeout)
+            raise WebServiceError("Call to the LDB Webservice timed out")
+
+    def close(self):
+        """
+        Release the worker threads owned by this session. Calls already running are not interrupted.
+        """
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class BoardStream(object):
+    """
+    An async iterator over the changes to a board published by a nredarwin.pubsub.BoardPublisher, yielding BoardDiffs.
+
+    The stream must be created in a coroutine, and updates are queued on the event loop running it. If the
+    consumer falls more than max_queued updates behind, the oldest are dropped; each BoardDiff carries the whole
+    board, so the latest state is never lost. Iteration ends once close() is called.
+    """
+
+    def __init__(self, publisher, crs, max_queued=100, **kwargs):
+        """
+        Constructor
+
+        Positional arguments:
+        publisher -- the BoardPublisher to subscribe to
+        crs -- the three letter CRS code of the station
+
+        Keyword arguments:
+        max_queued -- the most updates to hold for the consumer (default 100)
+        Any other keyword arguments are passed to get_station_board
+        """
+        self._loop = _running_loop()
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._closed = False
+        self._subscription = publisher.subscribe(crs, self._publish, **kwargs)
+
+    def _publish(self, changes):
+        #called on the publisher's poller thread
+        self._loop.call_soon_threadsafe(self._put, changes)
+
+    def _put(self, changes):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(changes)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        changes = await self._queue.get()
+        if changes is None:
+            raise StopAsyncIteration
+        return changes
+
+    def close(self):
+        """
+        Unsubscribe and end iteration
+        """
+        if not self._closed:
+            self._closed = True
+            self._subscription.cancel()
+            self._loop.call_soon_threadsafe(self._put, None)
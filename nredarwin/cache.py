@@ -0,0 +1,153 @@
+from collections import OrderedDict
+import threading
+
+from nredarwin.ratelimit import monotonic
+
+#query parameters holding CRS codes, which are case insensitive
+_CRS_PARAMS = ('crs', 'filterCrs')
+
+def query_key(operation, **params):
+    """
+    Return a hashable key identifying an LDB Webservice query, for use with ResponseCache.
+
+    The key is the operation name followed by sorted (name, value) parameter pairs, with CRS codes upper-cased
+    and parameters set to None left out.
+    """
+    normalized = []
+    for name, value in sorted(params.items()):
+        if value is None:
+            continue
+        if name in _CRS_PARAMS:
+            value = value.upper()
+        normalized.append((name, value))
+    return (operation,) + tuple(normalized)
+
+class _Flight(object):
+    #an upstream call which other callers asking for the same key can wait on
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class ResponseCache(object):
+    """
+    A thread-safe in-memory cache of LDB Webservice responses.
+
+    Entries are keyed on the normalized query, expire after a TTL which depends on the operation, and the least
+    recently used entries are evicted once the cache is full. Concurrent requests for the same key share a single
+    upstream call.
+
+    Cached StationBoard and ServiceDetails objects are shared between callers, so they must not be modified.
+    Any object with a get_or_load(key, loader) method can be given to DarwinLdbSession in place of this class.
+    """
+
+    default_ttls = {
+        'GetDepartureBoard': 30,
+        'GetArrivalBoard': 30,
+        'GetArrivalDepartureBoard': 30,
+        'GetServiceDetails': 60,
+    }
+
+    def __init__(self, max_entries=1000, ttls=None, default_ttl=30, clock=monotonic):
+        """
+        Constructor
+
+        Keyword arguments:
+        max_entries -- the maximum number of responses to hold (default 1000)
+        ttls -- a dict of seconds to keep responses for, keyed on operation name, overriding default_ttls
+        default_ttl -- seconds to keep responses to operations not in ttls (default 30)
+        """
+        self._max_entries = max_entries
+        self._ttls = dict(self.default_ttls)
+        self._ttls.update(ttls or {})
+        self._default_ttl = default_ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, key):
+        """
+        The number of seconds a response for key is kept. The first item of every key is the operation name
+        """
+        return self._ttls.get(key[0], self._default_ttl)
+
+    def get(self, key):
+        """
+        Return the cached response for key, or None if there isn't a fresh one
+        """
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        try:
+            expires, value = self._entries[key]
+        except KeyError:
+            return None
+        if expires <= self._clock():
+            del self._entries[key]
+            return None
+        #mark as most recently used
+        del self._entries[key]
+        self._entries[key] = (expires, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Store a response for key
+        """
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = (self._clock() + self.ttl(key), value)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached response for key, calling loader to fetch it if there isn't a fresh one.
+
+        If another thread is already loading the same key this waits for its result rather than calling loader.
+        Errors raised by loader are passed on to every waiting caller and are not cached.
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if flight.error is None and flight.value is not None:
+                    self._put(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, key=None):
+        """
+        Remove the response for key from the cache, or every response if key is None
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
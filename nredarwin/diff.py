@@ -0,0 +1,122 @@
+#the ServiceItem properties compared between boards
+DIFF_FIELDS = ('sta', 'eta', 'std', 'etd', 'platform', 'is_cancelled')
+
+class ServiceChange(object):
+    """
+    The changes to a single service between two station boards
+    """
+
+    def __init__(self, service, changes):
+        self._service = service
+        self._changes = changes
+
+    @property
+    def service(self):
+        """
+        The ServiceItem from the newer board
+        """
+        return self._service
+
+    @property
+    def service_id(self):
+        """
+        The Darwin LDB service id of the changed service
+        """
+        return self._service.service_id
+
+    @property
+    def changes(self):
+        """
+        A dict of (old value, new value) tuples keyed on the name of each changed property
+        """
+        return self._changes
+
+    def __repr__(self):
+        return "ServiceChange(%s, %r)" % (self.service_id, self._changes)
+
+class BoardDiff(object):
+    """
+    The differences between two snapshots of the same station board
+    """
+
+    def __init__(self, board, added, removed, changed):
+        self._board = board
+        self._added = added
+        self._removed = removed
+        self._changed = changed
+
+    @property
+    def board(self):
+        """
+        The newer StationBoard
+        """
+        return self._board
+
+    @property
+    def added(self):
+        """
+        A list of ServiceItems which appear on the newer board but not the older one
+        """
+        return self._added
+
+    @property
+    def removed(self):
+        """
+        A list of ServiceItems from the older board which no longer appear
+        """
+        return self._removed
+
+    @property
+    def changed(self):
+        """
+        A list of ServiceChange objects for services on both boards whose details have changed
+        """
+        return self._changed
+
+    def __bool__(self):
+        return bool(self._added or self._removed or self._changed)
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "BoardDiff(%s, %d added, %d removed, %d changed)" % (
+            self._board.crs, len(self._added), len(self._removed), len(self._changed))
+
+def _services_by_id(board):
+    services = {}
+    if board is not None:
+        for service_list in (board.train_services, board.bus_services, board.ferry_services):
+            for service in service_list:
+                services[service.service_id] = service
+    return services
+
+def diff_boards(previous, current, fields=DIFF_FIELDS):
+    """
+    Compare two snapshots of a station board, matching services on their service_id, and return a BoardDiff.
+
+    The BoardDiff is false if nothing has changed.
+
+    Positional arguments:
+    previous -- the older StationBoard, or None in which case every service on current is added
+    current -- the newer StationBoard
+
+    Keyword arguments:
+    fields -- the ServiceItem properties to compare (default DIFF_FIELDS)
+    """
+    old_services = _services_by_id(previous)
+    new_services = _services_by_id(current)
+    added = []
+    changed = []
+    for service_id, service in new_services.items():
+        old_service = old_services.get(service_id)
+        if old_service is None:
+            added.append(service)
+            continue
+        changes = {}
+        for field in fields:
+            old_value, new_value = getattr(old_service, field), getattr(service, field)
+            if old_value != new_value:
+                changes[field] = (old_value, new_value)
+        if changes:
+            changed.append(ServiceChange(service, changes))
+    removed = [service for service_id, service in old_services.items() if service_id not in new_services]
+    return BoardDiff(current, added, removed, changed)
@@ -0,0 +1,417 @@
+"""
+A local HTTP gateway holding one set of sessions, caches and rate limits for many clients.
+
+Run it with::
+
+    python -m nredarwin.gateway --port 8080 --api-key KEY [--api-key KEY ...]
+
+Queries are made with GET /<operation>?<parameters>, using the LDB Webservice's own operation and parameter
+names, for example /GetDepartureBoard?crs=MAN&numRows=10, and answered with the response model's to_dict() as
+JSON. GatewayClient makes these requests and has the same methods as DarwinLdbSession.
+
+Boards can also be followed as server-sent events from /stream/<operation>?<parameters>, with an event carrying
+the whole board each time it changes. Every client following the same board shares one poller.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import sys
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, urlencode, urlsplit
+    from urllib.request import urlopen
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import urlencode
+    from urllib2 import urlopen, HTTPError, URLError
+    from urlparse import parse_qsl, urlsplit
+
+from nredarwin import serialize
+from nredarwin.cache import ResponseCache, query_key
+from nredarwin.metrics import MetricsCollector
+from nredarwin.pool import SessionPool
+from nredarwin.pubsub import BoardPublisher
+from nredarwin.ratelimit import BudgetScheduler
+from nredarwin.resilience import CircuitOpenError
+from nredarwin.webservice import (DarwinLdbSession, LiteSoapEngine, QueryError, ServiceDetails, SessionBase,
+    StationBoard, WebServiceError)
+
+log = logging.getLogger(__name__)
+
+#the response model of each operation the gateway answers
+OPERATIONS = {
+    'GetDepartureBoard': StationBoard,
+    'GetArrivalBoard': StationBoard,
+    'GetArrivalDepartureBoard': StationBoard,
+    'GetServiceDetails': ServiceDetails,
+}
+
+#query parameters which are numbers
+_INTEGER_PARAMS = ('numRows', 'timeOffset', 'timeWindow')
+
+#the get_station_board include_departures and include_arrivals arguments for each board operation
+_BOARD_INCLUDES = {
+    'GetDepartureBoard': (True, False),
+    'GetArrivalBoard': (False, True),
+    'GetArrivalDepartureBoard': (True, True),
+}
+
+def board_arguments(operation, params):
+    """
+    Return the (crs, keyword arguments) to pass to get_station_board for a board query given as an operation and its
+    LDB Webservice parameters
+    """
+    if operation not in _BOARD_INCLUDES:
+        raise LookupError("Unknown board operation %s" % operation)
+    params = dict(params)
+    unknown = set(params) - set(('crs', 'numRows', 'filterCrs', 'filterType'))
+    if unknown:
+        raise ValueError("Unknown parameters for a board stream: %s" % ", ".join(sorted(unknown)))
+    if 'crs' not in params:
+        raise ValueError("A board stream needs a crs")
+    include_departures, include_arrivals = _BOARD_INCLUDES[operation]
+    kwargs = {'rows': int(params.get('numRows', 10)), 'include_departures': include_departures,
+        'include_arrivals': include_arrivals}
+    filter_type = params.get('filterType', 'to')
+    if filter_type not in ('to', 'from'):
+        raise ValueError("filterType must be to or from")
+    if params.get('filterCrs'):
+        kwargs['destination_crs' if filter_type == 'to' else 'origin_crs'] = params['filterCrs']
+    return params['crs'], kwargs
+
+def _put_latest(updates, item):
+    #put item on a queue of size one, replacing anything a slow reader hasn't taken yet
+    while True:
+        try:
+            updates.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                updates.get_nowait()
+            except queue.Empty:
+                pass
+
+class Gateway(object):
+    """
+    Answers queries from many clients with one session, as JSON.
+
+    Serialized responses are cached, with the same TTLs as ResponseCache, and identical queries which arrive
+    while one is being answered wait for it rather than querying the session again.
+    """
+
+    def __init__(self, session, max_entries=1000, ttls=None, metrics=None, publisher=None):
+        """
+        Constructor
+
+        Positional arguments:
+        session -- the DarwinLdbSession (or SessionPool, ResilientSession...) to make queries with
+
+        Keyword arguments:
+        max_entries -- the maximum number of serialized responses to hold (default 1000)
+        ttls -- a dict of seconds to keep responses for, keyed on operation name, overriding ResponseCache.default_ttls
+        metrics -- a MetricsCollector to publish at /metrics (default None)
+        publisher -- a BoardPublisher whose boards are streamed from /stream (default one polling session every 30 seconds)
+        """
+        self._session = session
+        self._responses = ResponseCache(max_entries=max_entries, ttls=ttls)
+        self._metrics = metrics
+        self._publisher = publisher or BoardPublisher(session)
+
+    @property
+    def session(self):
+        """
+        The session queries are made with
+        """
+        return self._session
+
+    @property
+    def metrics(self):
+        """
+        The MetricsCollector published at /metrics, or None
+        """
+        return self._metrics
+
+    @property
+    def publisher(self):
+        """
+        The BoardPublisher whose boards are streamed
+        """
+        return self._publisher
+
+    def query(self, operation, params):
+        """
+        Return the JSON encoded response to a query.
+
+        Positional arguments:
+        operation -- the name of one of OPERATIONS
+        params -- a dict of the operation's parameters, as strings or their own types
+
+        Raises LookupError for an unknown operation and ValueError for unknown or malformed parameters
+        """
+        model_class = OPERATIONS.get(operation)
+        if model_class is None:
+            raise LookupError("Unknown operation %s" % operation)
+        params = self._parse_params(operation, params)
+        return self._responses.get_or_load(query_key(operation, **params),
+            lambda: serialize.dumps(self._session.query_operation(model_class, operation, **params)))
+
+    def _parse_params(self, operation, params):
+        allowed = LiteSoapEngine.operations[operation][1]
+        unknown = set(params) - set(allowed)
+        if unknown:
+            raise ValueError("Unknown parameters for %s: %s" % (operation, ", ".join(sorted(unknown))))
+        parsed = {}
+        for name, value in params.items():
+            if name in _INTEGER_PARAMS:
+                value = int(value)
+            parsed[name] = value
+        return parsed
+
+class GatewayRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves queries to the Gateway held by the server
+    """
+    #seconds between comments sent to idle streams, which find clients that have gone away
+    keepalive = 15
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip('/')
+        if name == 'health':
+            return self._send(200, json.dumps({'status': 'ok'}).encode('utf-8'))
+        if name == 'metrics' and self.server.gateway.metrics is not None:
+            return self._send(200, self.server.gateway.metrics.prometheus_text().encode('utf-8'),
+                'text/plain; version=0.0.4')
+        if name.startswith('stream/'):
+            return self._stream(name[len('stream/'):], dict(parse_qsl(url.query)))
+        try:
+            body = self.server.gateway.query(name, dict(parse_qsl(url.query)))
+        except LookupError as e:
+            return self._error(404, e)
+        except ValueError as e:
+            return self._error(400, e)
+        except QueryError as e:
+            #the webservice rejected the query, e.g. for an unknown CRS code or service ID
+            return self._error(400, e)
+        except CircuitOpenError as e:
+            return self._error(503, e)
+        except WebServiceError as e:
+            return self._error(502, e)
+        except Exception as e:
+            log.exception("Answering %s failed", self.path)
+            return self._error(500, e)
+        self._send(200, body)
+
+    def _stream(self, operation, params):
+        try:
+            crs, kwargs = board_arguments(operation, params)
+        except LookupError as e:
+            return self._error(404, e)
+        except ValueError as e:
+            return self._error(400, e)
+        #a client which falls behind skips to the latest board rather than queueing every one
+        updates = queue.Queue(maxsize=1)
+        subscription = self.server.gateway.publisher.subscribe(crs,
+            lambda changes: _put_latest(updates, changes.board), **kwargs)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            while True:
+                try:
+                    board = updates.get(timeout=self.keepalive)
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                else:
+                    self.wfile.write(b'event: board\ndata: ' + serialize.dumps(board) + b'\n\n')
+                self.wfile.flush()
+        except (IOError, socket.error):
+            #the client has gone away
+            pass
+        finally:
+            subscription.cancel()
+            self.close_connection = True
+
+    def _error(self, status, error):
+        self._send(status, json.dumps({'error': str(error) or type(error).__name__}).encode('utf-8'))
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+class GatewayServer(ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server for a Gateway
+    """
+    daemon_threads = True
+
+    def __init__(self, address, gateway, handler=GatewayRequestHandler):
+        """
+        Constructor
+
+        Positional arguments:
+        address -- the (host, port) tuple to listen on, port 0 picking a free port
+        gateway -- the Gateway answering queries
+        """
+        HTTPServer.__init__(self, address, handler)
+        self.gateway = gateway
+
+class GatewayClient(SessionBase):
+    """
+    Makes queries through a gateway rather than calling the LDB Webservice itself.
+
+    The client has the same methods as DarwinLdbSession, and can be wrapped or polled in the same ways. Errors
+    from the gateway, or failures to reach it, are raised as WebServiceError, QueryError when the query was
+    invalid, or CircuitOpenError when its circuit breaker is open.
+    """
+
+    def __init__(self, url='http://127.0.0.1:8080', timeout=5):
+        """
+        Constructor
+
+        Keyword arguments:
+        url -- the base URL of the gateway (default http://127.0.0.1:8080)
+        timeout -- a timeout in seconds for requests to the gateway (default 5)
+        """
+        self._url = url.rstrip('/')
+        self._timeout = timeout
+
+    def _cached_query(self, model_class, operation, **params):
+        url = '%s/%s?%s' % (self._url, operation,
+            urlencode(sorted((name, value) for name, value in params.items() if value is not None)))
+        try:
+            response = urlopen(url, timeout=self._timeout)
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8'))['error']
+            except (ValueError, KeyError):
+                message = "The gateway answered %s with HTTP %d" % (operation, e.code)
+            raise _gateway_error(e.code)(message)
+        except (URLError, socket.error) as e:
+            #the gateway couldn't be reached or didn't answer in time
+            raise WebServiceError("Querying the gateway failed: %s" % (e or type(e).__name__))
+        try:
+            return serialize.loads(model_class, response.read())
+        except socket.error as e:
+            raise WebServiceError("Querying the gateway failed: %s" % (e or type(e).__name__))
+        finally:
+            response.close()
+
+    def stream_station_board(self, crs, rows=10, include_departures=True, include_arrivals=False, destination_crs=None,
+            origin_crs=None):
+        """
+        Follow a board through the gateway, yielding a StationBoard each time it changes. The generator runs until the
+        caller stops iterating or the gateway closes the stream, and raises socket.timeout if the gateway sends
+        nothing, not even the comments it keeps idle streams alive with, for the client's timeout or twice the
+        gateway's keepalive interval, whichever is longer.
+
+        Takes the same arguments as get_station_board
+        """
+        if include_departures and include_arrivals:
+            operation = 'GetArrivalDepartureBoard'
+        elif include_departures:
+            operation = 'GetDepartureBoard'
+        elif include_arrivals:
+            operation = 'GetArrivalBoard'
+        else:
+            raise ValueError("stream_station_board must have either include_departures or include_arrivals set to True")
+        params = [('crs', crs), ('numRows', rows)]
+        if destination_crs or origin_crs:
+            params.extend([('filterCrs', destination_crs or origin_crs), ('filterType', 'to' if destination_crs else 'from')])
+        try:
+            response = urlopen('%s/stream/%s?%s' % (self._url, operation, urlencode(params)),
+                timeout=max(self._timeout, 2 * GatewayRequestHandler.keepalive))
+        except HTTPError as e:
+            raise _gateway_error(e.code)("The gateway answered a %s stream with HTTP %d" % (operation, e.code))
+        except (URLError, socket.error) as e:
+            raise WebServiceError("Following a %s stream from the gateway failed: %s" % (operation, e or type(e).__name__))
+        try:
+            data = []
+            for line in iter(response.readline, b''):
+                line = line.rstrip(b'\r\n')
+                if line.startswith(b'data:'):
+                    data.append(line[5:].lstrip())
+                elif not line and data:
+                    yield serialize.loads(StationBoard, b'\n'.join(data))
+                    data = []
+        finally:
+            response.close()
+
+def _gateway_error(status):
+    #the exception class to raise for an HTTP error status from the gateway
+    if status == 503:
+        return CircuitOpenError
+    if 400 <= status < 500:
+        return QueryError
+    return WebServiceError
+
+def build_session(args, metrics=None):
+    """
+    Build the session a gateway run from the command line queries with, reporting every call to metrics if given
+    """
+    kwargs = {'engine': args.engine, 'instrument': metrics}
+    api_keys = args.api_key or [os.environ['DARWIN_WEBSERVICE_API_KEY']]
+
+    def scheduler_factory(api_key):
+        #each key has a quota of its own, shared with other processes through a file named after a hash of the key
+        state_file = None
+        if args.rate_limit_file:
+            state_file = '%s.%s' % (args.rate_limit_file, hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:12])
+        return BudgetScheduler(args.rate_limit, state_file=state_file)
+
+    if len(api_keys) > 1:
+        return SessionPool(api_keys=api_keys, scheduler_factory=scheduler_factory if args.rate_limit else None, **kwargs)
+    if args.rate_limit:
+        kwargs['scheduler'] = scheduler_factory(api_keys[0])
+    return DarwinLdbSession(api_key=api_keys[0], **kwargs)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve LDB Webservice queries as JSON over HTTP")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=8080, help="port to listen on")
+    parser.add_argument('--api-key', action='append', default=[],
+        help="an LDB Webservice API key, may be repeated to spread queries across keys "
+        "(default the DARWIN_WEBSERVICE_API_KEY environment variable)")
+    parser.add_argument('--engine', default='lite', choices=('lite', 'suds'), help="the SOAP engine to use")
+    parser.add_argument('--rate-limit', type=float, help="the most calls per second to make with each API key")
+    parser.add_argument('--rate-limit-file',
+        help="the start of the names of files sharing each key's rate limit with other processes")
+    parser.add_argument('--cache-size', type=int, default=1000, help="the most responses to cache")
+    parser.add_argument('--poll-interval', type=float, default=30, help="seconds between polls of streamed boards")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    metrics = MetricsCollector()
+    session = build_session(args, metrics)
+    gateway = Gateway(session, max_entries=args.cache_size, metrics=metrics,
+        publisher=BoardPublisher(session, interval=args.poll_interval))
+    server = GatewayServer((args.host, args.port), gateway)
+    log.info("Serving LDB Webservice queries on http://%s:%d", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
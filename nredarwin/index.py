@@ -0,0 +1,179 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+import threading
+
+#where a stop lies relative to the location a ServiceDetails was fetched for
+PREVIOUS = 'previous'
+CURRENT = 'current'
+SUBSEQUENT = 'subsequent'
+
+#the estimated or actual time Darwin gives a cancelled stop
+_CANCELLED = 'Cancelled'
+
+class Stop(object):
+    """
+    A station a service calls at, as recorded in a ServiceIndex
+    """
+    __slots__ = ('service_id', 'crs', 'location_name', 'scheduled', 'estimated', 'actual', 'part', 'branch', 'cancelled')
+
+    def __init__(self, service_id, crs, location_name, scheduled, estimated, actual, part, branch, cancelled=False):
+        self.service_id = service_id
+        self.crs = crs
+        self.location_name = location_name
+        #timezone-aware datetimes, or None
+        self.scheduled = scheduled
+        self.estimated = estimated
+        self.actual = actual
+        #PREVIOUS, CURRENT or SUBSEQUENT
+        self.part = part
+        #0 for the through service, or the position of the associated service which joins or splits from it
+        self.branch = branch
+        #True if the service won't call here
+        self.cancelled = cancelled
+
+    def __repr__(self):
+        return "Stop(%s, %s, %s)" % (self.service_id, self.crs, self.scheduled)
+
+def _calling_point_stops(service_id, calling_point_lists, part):
+    stops = []
+    for branch, calling_point_list in enumerate(calling_point_lists):
+        for point in calling_point_list.calling_points:
+            stops.append(Stop(service_id, point.crs, point.location_name, point.scheduled_time,
+                point.estimated_time, point.actual_time, part, branch, _CANCELLED in (point.et, point.at)))
+    return stops
+
+def _stops(service_id, details):
+    current = Stop(service_id, details.crs, details.location_name,
+        details.scheduled_departure or details.scheduled_arrival,
+        details.estimated_departure or details.estimated_arrival,
+        details.actual_departure or details.actual_arrival, CURRENT, 0,
+        bool(details.is_cancelled) or _CANCELLED in (details.etd, details.eta))
+    return (_calling_point_stops(service_id, details.previous_calling_point_lists, PREVIOUS) + [current] +
+        _calling_point_stops(service_id, details.subsequent_calling_point_lists, SUBSEQUENT))
+
+class ServiceIndex(object):
+    """
+    A thread-safe in-memory index of ServiceDetails across the network.
+
+    Services are looked up by service id and operator code in constant time, and by the stations they call at
+    within a time window by bisecting a per-station list sorted on scheduled time. Every calling point is indexed,
+    including those of associated services which join or split from the through service. Adding details for a
+    service already in the index replaces its previous entry.
+    """
+
+    def __init__(self):
+        self._services = {}
+        self._stops = {}
+        self._by_operator = defaultdict(set)
+        #per CRS code, a sorted list of (scheduled time, service id, id(stop), stop) tuples
+        self._by_crs = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, service_id, details):
+        """
+        Add or replace the ServiceDetails of a service
+        """
+        stops = _stops(service_id, details)
+        with self._lock:
+            self._remove(service_id)
+            self._services[service_id] = details
+            self._stops[service_id] = stops
+            if details.operator_code:
+                self._by_operator[details.operator_code].add(service_id)
+            for stop in stops:
+                if stop.crs and stop.scheduled is not None:
+                    insort(self._by_crs[stop.crs], (stop.scheduled, service_id, id(stop), stop))
+
+    def remove(self, service_id):
+        """
+        Remove a service from the index, if it is there
+        """
+        with self._lock:
+            self._remove(service_id)
+
+    def _remove(self, service_id):
+        details = self._services.pop(service_id, None)
+        if details is None:
+            return
+        operator_services = self._by_operator.get(details.operator_code)
+        if operator_services is not None:
+            operator_services.discard(service_id)
+            if not operator_services:
+                del self._by_operator[details.operator_code]
+        for stop in self._stops.pop(service_id):
+            if stop.crs and stop.scheduled is not None:
+                postings = self._by_crs[stop.crs]
+                position = bisect_left(postings, (stop.scheduled, service_id, id(stop)))
+                if position < len(postings) and postings[position][3] is stop:
+                    del postings[position]
+                if not postings:
+                    del self._by_crs[stop.crs]
+
+    def get(self, service_id):
+        """
+        Return the ServiceDetails of a service, or None if it isn't indexed
+        """
+        return self._services.get(service_id)
+
+    def stops(self, service_id):
+        """
+        Return every Stop of a service in calling order, branch by branch, or an empty list if it isn't indexed
+        """
+        return list(self._stops.get(service_id, ()))
+
+    def last_reported(self, service_id):
+        """
+        Return the last Stop of a service with an actual time, which is where it was last seen, or None
+        """
+        reported = [stop for stop in self._stops.get(service_id, ()) if stop.actual is not None]
+        return max(reported, key=lambda stop: stop.actual) if reported else None
+
+    def remaining_stops(self, service_id):
+        """
+        Return the Stops a service still has to call at, in calling order: the location its details were fetched for
+        and the subsequent calling points, after the last of them with an actual time and leaving out cancelled stops.
+        A report from any subsequent calling point means the service has left the current location. A portion which
+        splits off is followed from the station it leaves the through service at, so a report on it also passes the
+        through service's stops before the split
+        """
+        stops = [stop for stop in self._stops.get(service_id, ()) if stop.part != PREVIOUS]
+        branches = defaultdict(list)
+        for stop in stops:
+            if stop.part == SUBSEQUENT:
+                branches[stop.branch].append(stop)
+        through = branches[0]
+        passed = set()
+        for branch, branch_stops in branches.items():
+            route = branch_stops
+            if branch:
+                split = [i for i, stop in enumerate(through) if stop.crs == branch_stops[0].crs]
+                #the other portion may still be at the station where they split
+                route = through[:split[0]] + branch_stops if split else branch_stops
+            reported = [i for i, stop in enumerate(route) if stop.actual is not None]
+            if reported:
+                passed.update(id(stop) for stop in route[:reported[-1] + 1])
+                passed.update(id(stop) for stop in stops if stop.part == CURRENT)
+        return [stop for stop in stops if id(stop) not in passed and not stop.cancelled]
+
+    def calling_at(self, crs, start, end):
+        """
+        Return the Stops at a station scheduled from start up to but not including end, in time order
+        """
+        with self._lock:
+            postings = self._by_crs.get(crs.upper(), [])
+            first = bisect_left(postings, (start,))
+            last = bisect_left(postings, (end,))
+            return [posting[3] for posting in postings[first:last]]
+
+    def by_operator(self, operator_code):
+        """
+        Return the ids of the indexed services run by an operator
+        """
+        with self._lock:
+            return set(self._by_operator.get(operator_code, ()))
+
+    def __contains__(self, service_id):
+        return service_id in self._services
+
+    def __len__(self):
+        return len(self._services)
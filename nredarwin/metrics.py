@@ -0,0 +1,139 @@
+from collections import defaultdict
+import threading
+
+#timed phases of a call, in the order they happen
+PHASES = ('queued', 'network', 'unmarshal', 'build', 'total')
+
+_active = threading.local()
+
+def active_call():
+    """
+    Return the CallMetrics being recorded on this thread, or None if the session making the call isn't instrumented.
+
+    Engines and transports use this to add network timings and payload sizes to the call.
+    """
+    return getattr(_active, 'call', None)
+
+class recording(object):
+    """
+    A context manager making a CallMetrics the active call on this thread
+    """
+
+    def __init__(self, metrics):
+        self._metrics = metrics
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = active_call()
+        _active.call = self._metrics
+        return self._metrics
+
+    def __exit__(self, *exc_info):
+        _active.call = self._previous
+
+class CallMetrics(object):
+    """
+    Measurements of a single query made through an instrumented DarwinLdbSession.
+
+    Timings are in seconds. queued is time spent waiting for the session's scheduler, network is time spent
+    sending the request and reading the response, unmarshal is the rest of the engine's work building and parsing
+    SOAP, and build is time spent constructing the response model. Models build nested lists lazily, so build
+    doesn't include work done when those are first read. All four are 0 when the response came from the cache.
+    """
+
+    __slots__ = ('operation', 'cache_hit', 'queued', 'network', 'unmarshal', 'build', 'total', 'request_bytes',
+        'response_bytes', 'fault', 'error')
+
+    def __init__(self, operation):
+        self.operation = operation
+        #None when the session has no cache
+        self.cache_hit = None
+        self.queued = 0.0
+        self.network = 0.0
+        self.unmarshal = 0.0
+        self.build = 0.0
+        self.total = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        #True if the call failed with a WebServiceError
+        self.fault = False
+        #the name of any other exception raised by the call
+        self.error = None
+
+    def add_network(self, seconds, request_bytes, response_bytes):
+        """
+        Record an HTTP exchange made for this call
+        """
+        self.network += seconds
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+
+    @property
+    def outcome(self):
+        """
+        'ok', 'fault' or 'error'
+        """
+        if self.fault:
+            return 'fault'
+        return 'error' if self.error else 'ok'
+
+    def __repr__(self):
+        return "CallMetrics(%s, %s, %.4fs)" % (self.operation, self.outcome, self.total)
+
+class MetricsCollector(object):
+    """
+    A thread-safe running total of CallMetrics, which can be given to DarwinLdbSession as its instrument and
+    read out in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._calls = defaultdict(int)
+        self._cache = defaultdict(int)
+        self._seconds = defaultdict(float)
+        self._bytes = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics):
+        operation = metrics.operation
+        with self._lock:
+            self._calls[(operation, metrics.outcome)] += 1
+            if metrics.cache_hit is not None:
+                self._cache[(operation, 'hit' if metrics.cache_hit else 'miss')] += 1
+            for phase in PHASES:
+                self._seconds[(operation, phase)] += getattr(metrics, phase)
+            self._bytes[(operation, 'sent')] += metrics.request_bytes
+            self._bytes[(operation, 'received')] += metrics.response_bytes
+
+    def snapshot(self):
+        """
+        Return the totals so far as a dict of dicts keyed on label tuples: calls on (operation, outcome), cache on
+        (operation, hit or miss), seconds on (operation, phase) and bytes on (operation, sent or received)
+        """
+        with self._lock:
+            return {
+                'calls': dict(self._calls),
+                'cache': dict(self._cache),
+                'seconds': dict(self._seconds),
+                'bytes': dict(self._bytes),
+            }
+
+    def prometheus_text(self, prefix='nredarwin'):
+        """
+        Return the totals as counters in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        families = [
+            ('calls_total', 'Queries made to the LDB Webservice', 'calls', ('operation', 'outcome')),
+            ('cache_total', 'Queries answered by the cache or not', 'cache', ('operation', 'result')),
+            ('seconds_total', 'Time spent in each phase of a query', 'seconds', ('operation', 'phase')),
+            ('bytes_total', 'SOAP payload bytes', 'bytes', ('operation', 'direction')),
+        ]
+        lines = []
+        for name, help_text, key, label_names in families:
+            name = '%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s counter' % name)
+            for labels, value in sorted(snapshot[key].items()):
+                label_text = ','.join('%s="%s"' % pair for pair in zip(label_names, labels))
+                lines.append('%s{%s} %s' % (name, label_text, value))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,195 @@
+from collections import deque
+import copy
+import threading
+
+from nredarwin.ratelimit import monotonic
+from nredarwin.webservice import SessionBase, StationBoard
+
+#the board operations whose results can answer each board operation
+COVERING_OPERATIONS = {
+    'GetDepartureBoard': ('GetDepartureBoard', 'GetArrivalDepartureBoard'),
+    'GetArrivalBoard': ('GetArrivalBoard', 'GetArrivalDepartureBoard'),
+    'GetArrivalDepartureBoard': ('GetArrivalDepartureBoard',),
+}
+
+def _sort_time(operation):
+    #the scheduled time boards for an operation are ordered on
+    if operation == 'GetDepartureBoard':
+        return lambda service: service.scheduled_departure
+    if operation == 'GetArrivalBoard':
+        return lambda service: service.scheduled_arrival
+    return lambda service: service.scheduled_arrival or service.scheduled_departure
+
+def derive_board(board, source_operation, source_rows, operation, rows):
+    """
+    Return the board a narrower query would get, worked out from the board returned by a broader one, or None if
+    the broader board doesn't hold enough services to be sure of the answer.
+
+    Positional arguments:
+    board -- the StationBoard returned by the broader query
+    source_operation -- the operation of the broader query
+    source_rows -- the number of rows asked for by the broader query
+    operation -- the operation of the narrower query, one covered by source_operation in COVERING_OPERATIONS
+    rows -- the number of rows asked for by the narrower query, no more than source_rows
+    """
+    if source_operation not in COVERING_OPERATIONS.get(operation, ()) or rows > source_rows:
+        return None
+    split = source_operation != operation
+    source_sort_time = _sort_time(source_operation)
+    services = []
+    total = 0
+    #the latest time on the broader board, services it left out are all due no sooner
+    window_end = None
+    for dest_key, src_key in StationBoard.service_lists:
+        for service in board._materialized('_' + dest_key):
+            total += 1
+            due = source_sort_time(service)
+            if due is not None and (window_end is None or due > window_end):
+                window_end = due
+            if split and operation == 'GetDepartureBoard' and service.std is None:
+                continue
+            if split and operation == 'GetArrivalBoard' and service.sta is None:
+                continue
+            services.append((dest_key, service))
+    #a board with fewer services than it asked for holds every service in its time window
+    complete = total < source_rows
+    if split and len(services) < rows and not complete:
+        return None
+    sort_time = _sort_time(operation)
+    if len(services) > rows:
+        #keep the soonest services, those without a time last and otherwise in Darwin's order
+        timed = [(sort_time(service), i) for i, (key, service) in enumerate(services) if sort_time(service) is not None]
+        ranked = [i for time, i in sorted(timed)]
+        ranked.extend(i for i in range(len(services)) if sort_time(services[i][1]) is None)
+        keep = set(ranked[:rows])
+        services = [pair for i, pair in enumerate(services) if i in keep]
+    if split and not complete:
+        #a service which arrives long before it departs can put departures after the end of the broader board's
+        #window, where services it left out may depart sooner
+        for key, service in services:
+            due = sort_time(service)
+            if due is None or window_end is None or due > window_end:
+                return None
+    derived = copy.copy(board)
+    for dest_key, src_key in StationBoard.service_lists:
+        setattr(derived, '_' + dest_key, [service for key, service in services if key == dest_key])
+    return derived
+
+class _Result(object):
+    #a board query answered, or being answered, by the webservice
+    __slots__ = ('operation', 'rows', 'expires', 'board', 'done')
+
+    def __init__(self, operation, rows, expires):
+        self.operation = operation
+        self.rows = rows
+        self.expires = expires
+        self.board = None
+        self.done = threading.Event()
+
+class PlanningSession(SessionBase):
+    """
+    Answers station board queries from the results of broader ones where it can, without calling the webservice.
+
+    A board query is covered by an earlier one for the same station and filter which asked for at least as many
+    rows and either was the same kind of query or fetched arrivals and departures together. A covered query is
+    answered by truncating the broader board to the soonest services, or by picking out the departing or arriving
+    services, as long as the broader board holds enough of them, all due within its time window, to be sure of
+    the answer. Board queries which don't give a number of rows are passed straight on. Queries still waiting
+    for the webservice cover later ones too, which wait for them rather than making a call of their own. Queries
+    with a different filter are never derived from each other, as boards don't say where services call.
+
+    With min_rows set, board queries which do go to the webservice ask for at least that many rows, so that
+    later queries for fewer rows can be answered locally.
+
+    The session has the same methods as DarwinLdbSession.
+    """
+
+    def __init__(self, session, ttl=30, min_rows=None, clock=monotonic):
+        """
+        Constructor
+
+        Positional arguments:
+        session -- the DarwinLdbSession (or SessionPool, or ResilientSession) to make queries with
+
+        Keyword arguments:
+        ttl -- seconds a board is used to answer other queries (default 30)
+        min_rows -- the fewest rows to fetch for any board query (default None, fetch the rows asked for)
+        """
+        self._session = session
+        self._ttl = ttl
+        self._min_rows = min_rows
+        self._clock = clock
+        #lists of _Results, keyed on the station and filter
+        self._results = {}
+        #(group, result) for every result in the order they expire, so expired ones can be swept up
+        self._expiry = deque()
+        self._lock = threading.Lock()
+        #the number of board queries answered locally and by the wrapped session
+        self.derived = 0
+        self.fetched = 0
+
+    def _cached_query(self, model_class, operation, **params):
+        if operation not in COVERING_OPERATIONS or params.get('numRows') is None:
+            #without a number of rows the webservice's default applies, which can't be compared with other queries
+            return self._session._cached_query(model_class, operation, **params)
+        rows = params.pop('numRows')
+        group = tuple(sorted((name, value.upper() if name in ('crs', 'filterCrs') else value)
+            for name, value in params.items() if value is not None))
+        for result in self._candidates(group, operation, rows):
+            result.done.wait()
+            if result.board is None:
+                #the call failed
+                continue
+            board = derive_board(result.board, result.operation, result.rows, operation, rows)
+            if board is not None:
+                with self._lock:
+                    self.derived += 1
+                return board
+        fetch_rows = max(rows, self._min_rows or 0)
+        result = _Result(operation, fetch_rows, self._clock() + self._ttl)
+        with self._lock:
+            self._sweep()
+            self._results.setdefault(group, []).append(result)
+            self._expiry.append((group, result))
+            self.fetched += 1
+        try:
+            result.board = self._session._cached_query(model_class, operation, numRows=fetch_rows, **params)
+        except Exception:
+            with self._lock:
+                self._discard(group, result)
+            raise
+        finally:
+            result.done.set()
+        if fetch_rows == rows:
+            return result.board
+        return derive_board(result.board, operation, fetch_rows, operation, rows)
+
+    def _candidates(self, group, operation, rows):
+        #the unexpired results which cover a query, finished ones and those of the same kind first
+        now = self._clock()
+        with self._lock:
+            results = self._results.get(group)
+            if not results:
+                return []
+            results[:] = [result for result in results if result.expires > now]
+            if not results:
+                del self._results[group]
+                return []
+            covering = [result for result in results
+                if result.operation in COVERING_OPERATIONS[operation] and result.rows >= rows]
+        return sorted(covering, key=lambda result: (not result.done.is_set(), result.operation != operation, result.rows))
+
+    def _sweep(self):
+        #drop expired results, so boards of stations which aren't queried again don't stay in memory. Every result
+        #lives for the same ttl, so they expire in the order they were added
+        now = self._clock()
+        while self._expiry and self._expiry[0][1].expires <= now:
+            group, result = self._expiry.popleft()
+            self._discard(group, result)
+
+    def _discard(self, group, result):
+        results = self._results.get(group, [])
+        if result in results:
+            results.remove(result)
+        if not results:
+            self._results.pop(group, None)
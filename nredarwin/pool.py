@@ -0,0 +1,141 @@
+import logging
+import threading
+
+from nredarwin.ratelimit import monotonic
+from nredarwin.webservice import DarwinLdbSession, QueryError, SessionBase, WebServiceError
+
+log = logging.getLogger(__name__)
+
+#dispatch policies for SessionPool
+ROUND_ROBIN = 'round_robin'
+LEAST_LOADED = 'least_loaded'
+
+class _Member(object):
+    #a session in a pool and its bookkeeping
+    __slots__ = ('session', 'in_flight', 'calls', 'faults', 'suspended_until')
+
+    def __init__(self, session):
+        self.session = session
+        self.in_flight = 0
+        self.calls = 0
+        self.faults = 0
+        self.suspended_until = None
+
+class SessionPool(SessionBase):
+    """
+    Spreads queries across several sessions, normally one per API key, so throughput grows with the number of keys.
+
+    The pool has the same methods as DarwinLdbSession. Each query goes to one session, chosen round-robin or as the
+    one with fewest queries in flight. A session whose calls fail with max_faults WebServiceErrors in a row is
+    suspended for suspend_for seconds, then given another chance. QueryErrors, raised for invalid queries, don't
+    count as faults, since any session would fail them.
+    """
+
+    def __init__(self, sessions=(), api_keys=(), policy=LEAST_LOADED, max_faults=3, suspend_for=60,
+            scheduler_factory=None, clock=monotonic, **kwargs):
+        """
+        Constructor
+
+        Keyword arguments:
+        sessions -- DarwinLdbSessions to dispatch queries to
+        api_keys -- API keys to create further sessions for, each built with the remaining keyword arguments
+        policy -- ROUND_ROBIN or LEAST_LOADED (the default)
+        max_faults -- the number of consecutive faults after which a session is suspended (default 3)
+        suspend_for -- seconds a faulting session is left out for, or None to drop it for good (default 60)
+        scheduler_factory -- a callable given each of api_keys and returning the BudgetScheduler for its session, as every
+                             key has a quota of its own (default None, no scheduling)
+        Any other keyword arguments are passed to DarwinLdbSession for each of api_keys, so a cache given here is shared
+        """
+        api_keys = list(api_keys)
+        if 'scheduler' in kwargs and len(api_keys) > 1:
+            raise ValueError("SessionPool can't share one scheduler between API keys, pass scheduler_factory instead")
+        sessions = list(sessions)
+        for api_key in api_keys:
+            if scheduler_factory is not None:
+                kwargs['scheduler'] = scheduler_factory(api_key)
+            sessions.append(DarwinLdbSession(api_key=api_key, **kwargs))
+        if not sessions:
+            raise ValueError("SessionPool needs at least one session or API key")
+        if policy not in (ROUND_ROBIN, LEAST_LOADED):
+            raise ValueError("Unknown SessionPool policy %r" % (policy,))
+        self._members = [_Member(session) for session in sessions]
+        self._policy = policy
+        self._max_faults = max_faults
+        self._suspend_for = suspend_for
+        self._clock = clock
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @property
+    def sessions(self):
+        """
+        The sessions currently accepting queries
+        """
+        with self._lock:
+            return [member.session for member in self._available(self._clock())]
+
+    def stats(self):
+        """
+        Return a list of dicts, one per session in the order they were given, with its calls, in_flight, faults
+        and whether it is suspended
+        """
+        now = self._clock()
+        with self._lock:
+            return [{
+                'calls': member.calls,
+                'in_flight': member.in_flight,
+                'faults': member.faults,
+                'suspended': not self._is_available(member, now),
+            } for member in self._members]
+
+    def _is_available(self, member, now):
+        return member.suspended_until is None or member.suspended_until <= now
+
+    def _available(self, now):
+        return [member for member in self._members if self._is_available(member, now)]
+
+    def _checkout(self):
+        with self._lock:
+            available = self._available(self._clock())
+            if not available:
+                raise WebServiceError("Every session in the pool has been suspended after repeated faults")
+            if self._policy == ROUND_ROBIN:
+                member = available[self._next % len(available)]
+                self._next += 1
+            else:
+                member = min(available, key=lambda m: (m.in_flight, m.calls))
+            member.in_flight += 1
+            member.calls += 1
+            return member
+
+    def _checkin(self, member, faulted):
+        with self._lock:
+            member.in_flight -= 1
+            if not faulted:
+                member.faults = 0
+                return
+            member.faults += 1
+            if member.faults >= self._max_faults:
+                member.faults = 0
+                if self._suspend_for is None:
+                    member.suspended_until = float('inf')
+                else:
+                    member.suspended_until = self._clock() + self._suspend_for
+                log.warning("Suspending session %d of the pool after %d consecutive faults",
+                    self._members.index(member), self._max_faults)
+
+    def _cached_query(self, model_class, operation, **params):
+        member = self._checkout()
+        try:
+            result = member.session._cached_query(model_class, operation, **params)
+        except QueryError:
+            self._checkin(member, False)
+            raise
+        except WebServiceError:
+            self._checkin(member, True)
+            raise
+        except Exception:
+            self._checkin(member, False)
+            raise
+        self._checkin(member, False)
+        return result
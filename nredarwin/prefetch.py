@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
+from nredarwin.cache import ResponseCache, query_key
+from nredarwin.ratelimit import RateLimiter, background
+from nredarwin.webservice import WebServiceError
+
+log = logging.getLogger(__name__)
+
+class ServiceDetailsPrefetcher(object):
+    """
+    Fetches the details of the services on station boards in the background, ready for when they're asked for.
+
+    Service ids are deduplicated across boards, so a service seen at several stations is fetched once, and details
+    are kept for a freshness window before being fetched again. get_service_details answers from the prefetched
+    details, waits for a prefetch already under way, or fetches the service itself.
+    """
+
+    def __init__(self, session, workers=8, freshness=60, max_entries=5000, rate_limit=None):
+        """
+        Constructor
+
+        Positional arguments:
+        session -- the DarwinLdbSession (or SessionPool) to fetch details with
+
+        Keyword arguments:
+        workers -- the number of details to fetch in parallel (default 8)
+        freshness -- seconds prefetched details are served for (default 60)
+        max_entries -- the maximum number of services to hold (default 5000)
+        rate_limit -- the maximum number of prefetches to start per second (default None, unlimited)
+        """
+        self._session = session
+        self._cache = ResponseCache(max_entries=max_entries, ttls={'GetServiceDetails': freshness})
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._limiter = RateLimiter(rate_limit) if rate_limit else None
+        #futures for services queued or being fetched, keyed on service id
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, boards):
+        """
+        Schedule fetches for the services on one or more StationBoards which aren't already fresh or queued, and
+        return the number scheduled
+        """
+        if hasattr(boards, 'train_services'):
+            boards = [boards]
+        scheduled = 0
+        for board in boards:
+            for services in (board.train_services, board.bus_services, board.ferry_services):
+                for service in services:
+                    service_id = service.service_id
+                    with self._lock:
+                        if service_id in self._queued or self._cache.get(self._key(service_id)) is not None:
+                            continue
+                        self._queued[service_id] = self._executor.submit(self._prefetch, service_id)
+                    scheduled += 1
+        return scheduled
+
+    def _key(self, service_id):
+        return query_key('GetServiceDetails', serviceID=service_id)
+
+    def _prefetch(self, service_id):
+        try:
+            if self._limiter:
+                self._limiter.acquire()
+            with background():
+                self._load(service_id)
+        except WebServiceError:
+            log.warning("Prefetching the details of service %s failed", service_id)
+        except Exception:
+            log.exception("Prefetching the details of service %s failed", service_id)
+        finally:
+            with self._lock:
+                self._queued.pop(service_id, None)
+
+    def _load(self, service_id):
+        return self._cache.get_or_load(self._key(service_id), lambda: self._session.get_service_details(service_id))
+
+    def get_service_details(self, service_id):
+        """
+        Return a ServiceDetails instance for a service, prefetched if possible
+        """
+        return self._load(service_id)
+
+    def close(self):
+        """
+        Stop prefetching, abandoning any fetches not yet started
+        """
+        with self._lock:
+            for future in self._queued.values():
+                future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,174 @@
+import logging
+import threading
+
+from nredarwin.diff import diff_boards
+from nredarwin.ratelimit import RateLimiter, background
+
+log = logging.getLogger(__name__)
+
+def subscription_key(crs, **kwargs):
+    """
+    Return a hashable key identifying the board a subscription is for. Subscriptions with the same key share a poller
+    """
+    return (crs.upper(),) + tuple(sorted((name, value.upper() if name.endswith('_crs') and value else value)
+        for name, value in kwargs.items()))
+
+class Subscription(object):
+    """
+    A subscriber's interest in a board, returned by BoardPublisher.subscribe
+    """
+
+    def __init__(self, publisher, key, callback):
+        self._publisher = publisher
+        self._key = key
+        self._callback = callback
+
+    @property
+    def key(self):
+        """
+        The subscription_key of the board subscribed to
+        """
+        return self._key
+
+    def cancel(self):
+        """
+        Stop receiving updates. The board stops being polled once it has no subscribers left
+        """
+        self._publisher.unsubscribe(self)
+
+class _Feed(object):
+    #a board being polled for its subscribers
+
+    def __init__(self, crs, kwargs):
+        self.crs = crs
+        self.kwargs = kwargs
+        self.subscriptions = []
+        self.board = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+class BoardPublisher(object):
+    """
+    Polls each distinct board subscribed to once, however many subscribers it has, and pushes its changes to all of them.
+
+    Subscribers register a callback for a station and the same filters as get_station_board. Each distinct board has
+    a single poller thread, started with its first subscriber and stopped when its last one leaves, so calls to the
+    webservice grow with the number of distinct boards rather than the number of subscribers. Callbacks are given a
+    BoardDiff each time the board changes, and run on the poller's thread, so they should hand work on rather than
+    block. A subscriber joining a board which is already being polled is given the latest board at once, as a diff
+    in which every service is added.
+    """
+
+    def __init__(self, session, interval=30, rate_limit=None):
+        """
+        Constructor
+
+        Positional arguments:
+        session -- the DarwinLdbSession (or SessionPool, GatewayClient...) to fetch boards with
+
+        Keyword arguments:
+        interval -- seconds between polls of each board (default 30)
+        rate_limit -- the maximum number of polls per second across all boards (default None, unlimited)
+        """
+        self._session = session
+        self._interval = interval
+        self._limiter = RateLimiter(rate_limit) if rate_limit else None
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, crs, callback, **kwargs):
+        """
+        Start receiving the changes to a board and return a Subscription.
+
+        Positional arguments:
+        crs -- the three letter CRS code of the station
+        callback -- called with a BoardDiff each time the board changes
+
+        Any keyword arguments are passed to get_station_board
+        """
+        key = subscription_key(crs, **kwargs)
+        subscription = Subscription(self, key, callback)
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None:
+                feed = self._feeds[key] = _Feed(crs.upper(), kwargs)
+                feed.thread = threading.Thread(target=self._poll, args=(feed,), name="nredarwin-board-%s" % feed.crs)
+                feed.thread.daemon = True
+                feed.thread.start()
+            feed.subscriptions.append(subscription)
+            board = feed.board
+        if board is not None:
+            self._deliver(subscription, diff_boards(None, board))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Stop sending updates to a subscription
+        """
+        with self._lock:
+            feed = self._feeds.get(subscription.key)
+            if feed is None or subscription not in feed.subscriptions:
+                return
+            feed.subscriptions.remove(subscription)
+            if not feed.subscriptions:
+                del self._feeds[subscription.key]
+                feed.stopped.set()
+
+    def subscriber_count(self, crs=None, **kwargs):
+        """
+        The number of subscriptions to a board, or to every board if crs is None
+        """
+        with self._lock:
+            if crs is None:
+                return sum(len(feed.subscriptions) for feed in self._feeds.values())
+            feed = self._feeds.get(subscription_key(crs, **kwargs))
+            return len(feed.subscriptions) if feed else 0
+
+    @property
+    def feed_count(self):
+        """
+        The number of distinct boards being polled
+        """
+        return len(self._feeds)
+
+    def _poll(self, feed):
+        while not feed.stopped.is_set():
+            if self._limiter:
+                self._limiter.acquire()
+            try:
+                with background():
+                    board = self._session.get_station_board(feed.crs, **feed.kwargs)
+            except Exception:
+                #a WebServiceError, or e.g. a timeout from a session which doesn't wrap its transport's errors, the
+                #feed must keep polling
+                log.warning("Polling the %s board failed, will retry in %s seconds", feed.crs, self._interval,
+                    exc_info=True)
+            else:
+                with self._lock:
+                    changes = diff_boards(feed.board, board)
+                    feed.board = board
+                    subscriptions = list(feed.subscriptions) if changes else []
+                for subscription in subscriptions:
+                    self._deliver(subscription, changes)
+            feed.stopped.wait(self._interval)
+
+    def _deliver(self, subscription, changes):
+        try:
+            subscription._callback(changes)
+        except Exception:
+            log.exception("Board subscriber callback failed")
+
+    def close(self):
+        """
+        Stop polling every board
+        """
+        with self._lock:
+            for feed in self._feeds.values():
+                feed.stopped.set()
+            self._feeds.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
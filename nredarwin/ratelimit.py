@@ -0,0 +1,243 @@
+import struct
+import threading
+import time
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#time.monotonic isn't available on python 2
+monotonic = getattr(time, 'monotonic', time.time)
+
+class RateLimiter(object):
+    """
+    A thread-safe token bucket limiting how often calls can be made to the LDB Webservice
+    """
+
+    def __init__(self, rate, burst=1, clock=monotonic, sleep=time.sleep):
+        """
+        Constructor
+
+        Positional arguments:
+        rate -- the sustained number of calls permitted per second
+
+        Keyword arguments:
+        burst -- the number of calls that may be made back to back before the rate applies (default 1)
+        """
+        if rate <= 0:
+            raise ValueError("RateLimiter rate must be greater than zero")
+        self._rate = float(rate)
+        self._burst = max(1, burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self._burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """
+        The sustained number of calls permitted per second
+        """
+        return self._rate
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        Take a token if one is available without waiting. Returns True if a call may be made
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """
+        Block until a call may be made
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            self._sleep(wait)
+
+#query priorities for BudgetScheduler
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority = threading.local()
+
+def current_priority():
+    """
+    The priority of queries made on this thread, INTERACTIVE unless inside a background() block
+    """
+    return getattr(_priority, 'value', INTERACTIVE)
+
+class background(object):
+    """
+    A context manager marking queries made on this thread as BACKGROUND, so a BudgetScheduler lets interactive
+    queries go first. DarwinLdbSession uses this for polling and bulk fetches
+    """
+
+    def __enter__(self):
+        self._previous = current_priority()
+        _priority.value = BACKGROUND
+
+    def __exit__(self, *exc_info):
+        _priority.value = self._previous
+
+#budget state kept in a shared file: tokens, time last updated and rate factor
+_STATE = struct.Struct('<ddd')
+
+class BudgetScheduler(object):
+    """
+    A thread-safe scheduler keeping queries made with an access token within its request quota.
+
+    The quota is a number of requests per window of seconds, spent from a token bucket which refills
+    continuously and holds at most one window's worth, or enough for a single query if that is more. Part of
+    the budget is reserved for INTERACTIVE queries, and background queries wait whenever an interactive one on
+    the same scheduler is waiting. Each fault halves the rate, down to min_factor of the quota, and each
+    success after that restores a little of it, so bursts of quota errors back off quickly.
+
+    Given a state_file the budget is kept in that file under an exclusive lock, and shared by every process on
+    the machine using the same file. This needs fcntl, so is not available on Windows.
+
+    A scheduler can be given to DarwinLdbSession, which acquires from it before every call to the webservice.
+    """
+
+    def __init__(self, requests, window=1.0, reserve=0.2, min_factor=0.1, recovery=0.05, state_file=None,
+            clock=None, sleep=time.sleep):
+        """
+        Constructor
+
+        Positional arguments:
+        requests -- the number of requests permitted per window
+
+        Keyword arguments:
+        window -- the length of the quota window in seconds (default 1)
+        reserve -- the fraction of the budget background queries may not use (default 0.2)
+        min_factor -- the smallest fraction of the quota faults can reduce the rate to (default 0.1)
+        recovery -- the fraction of the quota restored by each successful call while backed off (default 0.05)
+        state_file -- a file in which to share the budget between processes (default None, this process only)
+        """
+        if requests <= 0 or window <= 0:
+            raise ValueError("BudgetScheduler requests and window must be greater than zero")
+        if state_file and fcntl is None:
+            raise ValueError("A shared BudgetScheduler state_file needs fcntl, which isn't available on this platform")
+        self._rate = requests / float(window)
+        self._reserve = reserve * requests
+        #the bucket must hold a whole query above the reserve, or small quotas would never let one through
+        self._capacity = max(float(requests), 1.0 + self._reserve)
+        self._min_factor = min_factor
+        self._recovery = recovery
+        self._state_file = state_file
+        #processes only share a wall clock
+        self._clock = clock or (time.time if state_file else monotonic)
+        self._sleep = sleep
+        self._state = (self._capacity, self._clock(), 1.0)
+        self._interactive_waiting = 0
+        self._lock = threading.Lock()
+
+    @property
+    def factor(self):
+        """
+        The fraction of the quota currently allowed, below 1 while backing off after faults
+        """
+        with self._lock:
+            return self._update(lambda tokens, updated, factor: (factor, (tokens, updated, factor)))
+
+    def acquire(self, priority=None):
+        """
+        Block until a query may be made.
+
+        Keyword arguments:
+        priority -- INTERACTIVE or BACKGROUND (default the current_priority of this thread)
+        """
+        if priority is None:
+            priority = current_priority()
+        interactive = priority == INTERACTIVE
+        with self._lock:
+            if interactive:
+                self._interactive_waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    wait = self._update(lambda *state: self._take(interactive, *state))
+                if not wait:
+                    return
+                self._sleep(wait)
+        finally:
+            if interactive:
+                with self._lock:
+                    self._interactive_waiting -= 1
+
+    def try_acquire(self, priority=None):
+        """
+        Take from the budget if a query may be made now without waiting. Returns True if it may
+        """
+        if priority is None:
+            priority = current_priority()
+        with self._lock:
+            return not self._update(lambda *state: self._take(priority == INTERACTIVE, *state))
+
+    def record_fault(self):
+        """
+        Report a query which failed because of the quota, the webservice or the network, halving the rate. Queries
+        the webservice rejected as invalid (QueryErrors) shouldn't be reported
+        """
+        with self._lock:
+            self._update(lambda tokens, updated, factor: (None, (0.0, updated, max(self._min_factor, factor / 2))))
+
+    def record_success(self):
+        """
+        Report a query which succeeded, restoring some of the rate if it has been reduced
+        """
+        with self._lock:
+            self._update(lambda tokens, updated, factor: (None, (tokens, updated, min(1.0, factor + self._recovery))))
+
+    def _take(self, interactive, tokens, updated, factor):
+        rate = self._rate * factor
+        floor = 1.0 if interactive else 1.0 + self._reserve
+        if not interactive and self._interactive_waiting:
+            #let waiting interactive queries have the next token
+            return 1.0 / rate, (tokens, updated, factor)
+        #allow for rounding in the refill, which could otherwise leave a token forever just out of reach
+        if tokens >= floor - 1e-9:
+            return 0, (tokens - 1, updated, factor)
+        return (floor - tokens) / rate, (tokens, updated, factor)
+
+    def _update(self, change):
+        #refill the bucket, apply change(tokens, updated, factor) -> (result, new state) and store the new state.
+        #must be called holding self._lock
+        if self._state_file is None:
+            result, self._state = change(*self._refill(self._state))
+            return result
+        with open(self._state_file, 'a+b') as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                fh.seek(0)
+                data = fh.read(_STATE.size)
+                state = _STATE.unpack(data) if len(data) == _STATE.size else (self._capacity, self._clock(), 1.0)
+                result, state = change(*self._refill(state))
+                fh.seek(0)
+                fh.truncate()
+                fh.write(_STATE.pack(*state))
+                fh.flush()
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        return result
+
+    def _refill(self, state):
+        tokens, updated, factor = state
+        now = self._clock()
+        tokens = min(self._capacity, tokens + max(0.0, now - updated) * self._rate * factor)
+        return tokens, now, factor
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+from nredarwin.transport import HttpError
+
+_TOKEN_RE = re.compile(br'(<(?:\w+:)?TokenValue>)[^<]*(</(?:\w+:)?TokenValue>)')
+_OPERATION_RE = re.compile(br'<(?:\w+:)?(Get\w+)Request[\s>/]')
+
+def scrub_token(body):
+    """
+    Return a SOAP request with the value of its access token removed
+    """
+    return _TOKEN_RE.sub(br'\1\2', body)
+
+def request_operation(body):
+    """
+    Return the name of the LDB operation a SOAP request calls, or None
+    """
+    match = _OPERATION_RE.search(body)
+    return match.group(1).decode('ascii') if match else None
+
+def exchange_key(body):
+    """
+    Return the name under which the exchange for a SOAP request is recorded.
+
+    The key is the operation name and a hash of the request with its access token removed, so recordings
+    made with one API key replay for any other.
+    """
+    digest = hashlib.sha1(scrub_token(body)).hexdigest()[:16]
+    return '%s-%s' % (request_operation(body) or 'Unknown', digest)
+
+class RecordingTransport(object):
+    """
+    An HTTP transport which passes requests on to another transport and records each exchange to a directory.
+
+    Responses are saved as <key>.xml and requests, without their access token, as <key>.request.xml, where the
+    key comes from exchange_key. Like PooledHttpTransport it can be given to DarwinLdbSession as its http_pool.
+    """
+
+    def __init__(self, directory, transport=None):
+        """
+        Constructor
+
+        Positional arguments:
+        directory -- the directory to record exchanges in, created if necessary
+
+        Keyword arguments:
+        transport -- the transport making the real requests (default the shared PooledHttpTransport)
+        """
+        if transport is None:
+            from nredarwin.transport import default_http_pool
+            transport = default_http_pool()
+        self._directory = directory
+        self._transport = transport
+        self._lock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Make an HTTP request and return a (status, headers, body) tuple, recording the exchange
+        """
+        status, response_headers, data = self._transport.request(method, url, body, headers, timeout)
+        if body and status in (200, 500):
+            self._record(body, data)
+        return status, response_headers, data
+
+    def __call__(self, url, body, headers, timeout=None):
+        status, response_headers, data = self.request('POST', url, body, headers, timeout)
+        if status in (200, 500):
+            return data
+        raise HttpError(status, body=data)
+
+    def _record(self, body, data):
+        key = exchange_key(body)
+        with self._lock:
+            if not os.path.isdir(self._directory):
+                os.makedirs(self._directory)
+            with open(os.path.join(self._directory, key + '.request.xml'), 'wb') as fh:
+                fh.write(scrub_token(body))
+            with open(os.path.join(self._directory, key + '.xml'), 'wb') as fh:
+                fh.write(data)
+
+class ReplayTransport(object):
+    """
+    An HTTP transport which answers SOAP requests from recorded or canned responses without touching the network.
+
+    Each request is answered with the response recorded for the identical request if there is one, otherwise
+    with the canned response for its operation. Like PooledHttpTransport it can be given to DarwinLdbSession
+    as its http_pool.
+    """
+
+    def __init__(self, directory=None, responses=None, latency=0, sleep=time.sleep):
+        """
+        Constructor
+
+        Keyword arguments:
+        directory -- a directory of exchanges saved by RecordingTransport
+        responses -- a dict of response bodies keyed on operation name, e.g. {'GetDepartureBoard': b'<soap:Envelope...'}
+        latency -- seconds to wait before answering each request, to simulate the network (default 0)
+        """
+        self._recorded = {}
+        if directory:
+            for filename in os.listdir(directory):
+                if filename.endswith('.xml') and not filename.endswith('.request.xml'):
+                    with open(os.path.join(directory, filename), 'rb') as fh:
+                        self._recorded[filename[:-len('.xml')]] = fh.read()
+        self._responses = dict(responses or {})
+        self._latency = latency
+        self._sleep = sleep
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def request_count(self):
+        """
+        The number of requests answered so far
+        """
+        return self._count
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Answer an HTTP request, returning a (status, headers, body) tuple.
+
+        Raises LookupError if there is no response for the request
+        """
+        data = self._recorded.get(exchange_key(body or b''))
+        if data is None:
+            data = self._responses.get(request_operation(body or b''))
+        if data is None:
+            raise LookupError("No recorded response for %s" % exchange_key(body or b''))
+        if self._latency:
+            self._sleep(self._latency)
+        with self._lock:
+            self._count += 1
+        return 200, {'Content-Type': 'text/xml; charset=utf-8'}, data
+
+    def __call__(self, url, body, headers, timeout=None):
+        return self.request('POST', url, body, headers, timeout)[2]
+
+    def close(self):
+        pass
@@ -0,0 +1,264 @@
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import copy
+import logging
+import threading
+
+from suds.transport import TransportError
+
+from nredarwin.cache import query_key
+from nredarwin.ratelimit import monotonic
+from nredarwin.webservice import QueryError, SessionBase, WebServiceError
+
+log = logging.getLogger(__name__)
+
+#errors from a call to the webservice after which the last good response is served
+UPSTREAM_ERRORS = (WebServiceError, IOError, TransportError)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(WebServiceError):
+    """
+    Raised instead of calling the webservice while the circuit breaker is open and there is no earlier response to serve
+    """
+
+class CircuitBreaker(object):
+    """
+    A thread-safe circuit breaker for calls to the LDB Webservice.
+
+    The circuit opens after failure_threshold consecutive calls have failed or taken longer than latency_slo.
+    While open no calls are allowed. After reset_timeout seconds it is half open, and a single probe call is
+    allowed through: if that succeeds within the SLO the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold=5, latency_slo=None, reset_timeout=30, clock=monotonic):
+        """
+        Constructor
+
+        Keyword arguments:
+        failure_threshold -- the number of consecutive failed or slow calls which open the circuit (default 5)
+        latency_slo -- seconds after which a successful call counts as a failure (default None, no limit)
+        reset_timeout -- seconds the circuit stays open before a probe call is allowed (default 30)
+        """
+        self._failure_threshold = failure_threshold
+        self._latency_slo = latency_slo
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        CLOSED, OPEN or HALF_OPEN
+        """
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return CLOSED
+        if self._clock() - self._opened_at >= self._reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self):
+        """
+        Return True if a call may be made now. In the half open state only the first caller is allowed through
+        """
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self, latency=0):
+        """
+        Report a call which succeeded, taking latency seconds
+        """
+        if self._latency_slo is not None and latency > self._latency_slo:
+            log.warning("LDB Webservice call took %.2fs, beyond the %.2fs SLO", latency, self._latency_slo)
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """
+        Report a call which failed
+        """
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._failure_threshold:
+                if self._opened_at is None or self._probing:
+                    log.warning("Opening the LDB Webservice circuit breaker after %d failures", self._failures)
+                self._opened_at = self._clock()
+                self._probing = False
+
+    def record_ignored(self):
+        """
+        Report a call whose outcome says nothing about the webservice's health, such as an invalid query. Failures
+        aren't counted or reset, but a probe call is allowed through again
+        """
+        with self._lock:
+            self._probing = False
+
+class ResilientSession(SessionBase):
+    """
+    Keeps answering queries while the LDB Webservice is failing or slow, from the last good response to each query.
+
+    Queries go to the wrapped session through a CircuitBreaker. If a call fails, takes longer than call_timeout,
+    or the circuit is open, the last good response to the same query is returned instead, as a copy whose
+    is_stale property is True; age() tells how old it is. Calls which time out carry on in the background and
+    refresh the last good response when they finish, and while the circuit is half open the probe call is made in
+    the background too. Queries with no earlier response are made on the caller's thread, and wait for the
+    webservice or raise CircuitOpenError.
+
+    Queries with an earlier response are each made on a thread of their own, so call_timeout only ever counts time
+    spent on the call, never time queued behind others. Concurrent queries for the same thing share one call. At
+    most max_background of these calls run at once; while they are all busy other such queries get the last good
+    response, marked as stale, without calling the webservice.
+
+    Invalid queries (QueryErrors) are always raised, and don't count as failures of the webservice.
+
+    The session has the same methods as DarwinLdbSession.
+    """
+
+    def __init__(self, session, breaker=None, call_timeout=2, max_entries=1000, max_stale_age=None, max_background=8,
+            clock=monotonic):
+        """
+        Constructor
+
+        Positional arguments:
+        session -- the DarwinLdbSession (or SessionPool) to make queries with
+
+        Keyword arguments:
+        breaker -- a CircuitBreaker (default one with default settings)
+        call_timeout -- seconds to wait for the webservice before serving the last good response, if there is one (default 2)
+        max_entries -- the maximum number of last good responses to keep (default 1000)
+        max_stale_age -- seconds after which a last good response is too old to serve (default None, no limit)
+        max_background -- the maximum number of calls for queries with a last good response running at once (default 8)
+        """
+        self._session = session
+        self._breaker = breaker or CircuitBreaker(clock=clock)
+        self._call_timeout = call_timeout
+        self._max_entries = max_entries
+        self._max_stale_age = max_stale_age
+        self._clock = clock
+        self._last_good = OrderedDict()
+        self._inflight = {}
+        self._background_slots = threading.Semaphore(max_background)
+        self._lock = threading.Lock()
+
+    @property
+    def breaker(self):
+        """
+        The CircuitBreaker guarding calls to the webservice
+        """
+        return self._breaker
+
+    def _cached_query(self, model_class, operation, **params):
+        key = query_key(operation, **params)
+        last_good = self._last_good_response(key)
+        if not self._breaker.allow():
+            if last_good is None:
+                raise CircuitOpenError("The LDB Webservice circuit breaker is open")
+            return self._mark_stale(last_good)
+        if last_good is None:
+            return self._call(key, model_class, operation, params)
+        future = self._background_call(key, model_class, operation, params)
+        if future is None:
+            #every background call is busy, give up the probe if this was one
+            self._breaker.record_ignored()
+            return self._mark_stale(last_good)
+        #while half open the probe runs in the background, callers get the last good response at once
+        timeout = 0 if self._breaker.state == HALF_OPEN else self._call_timeout
+        try:
+            return future.result(timeout=timeout)
+        except QueryError:
+            #the query itself was wrong, an earlier answer to it won't help
+            raise
+        except (FutureTimeout,) + UPSTREAM_ERRORS:
+            return self._mark_stale(last_good)
+
+    def _call(self, key, model_class, operation, params):
+        started = self._clock()
+        try:
+            result = self._session._cached_query(model_class, operation, **params)
+        except QueryError:
+            #the webservice answered, the query itself was wrong
+            self._breaker.record_ignored()
+            raise
+        except Exception:
+            #anything unexpected counts too, so a failed probe can't leave the breaker half open for good
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success(self._clock() - started)
+        with self._lock:
+            self._last_good.pop(key, None)
+            self._last_good[key] = (self._clock(), result)
+            while len(self._last_good) > self._max_entries:
+                self._last_good.popitem(last=False)
+        return result
+
+    def _background_call(self, key, model_class, operation, params):
+        #start a call for key on a new thread unless one is already running, and return its future. Returns None
+        #if max_background calls are already running
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            if not self._background_slots.acquire(False):
+                return None
+            future = self._inflight[key] = Future()
+        thread = threading.Thread(target=self._run, args=(future, key, model_class, operation, params),
+            name="nredarwin-resilient-call")
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def _run(self, future, key, model_class, operation, params):
+        try:
+            result = self._call(key, model_class, operation, params)
+        except Exception as e:
+            self._finished(key, future)
+            future.set_exception(e)
+        else:
+            self._finished(key, future)
+            future.set_result(result)
+
+    def _finished(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        self._background_slots.release()
+
+    def _last_good_response(self, key):
+        with self._lock:
+            entry = self._last_good.get(key)
+        if entry is None:
+            return None
+        fetched, result = entry
+        if self._max_stale_age is not None and self._clock() - fetched > self._max_stale_age:
+            return None
+        return result
+
+    def _mark_stale(self, result):
+        #a copy of a last good response marked as stale, the original may be held by other callers. Response
+        #models copy without building their lazy lists
+        stale = copy.copy(result)
+        try:
+            stale._stale = True
+        except AttributeError:
+            #not a response model which can carry the mark
+            pass
+        return stale
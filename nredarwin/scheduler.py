@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from nredarwin.diff import diff_boards
+from nredarwin.ratelimit import RateLimiter, background, monotonic
+
+log = logging.getLogger(__name__)
+
+class _Station(object):
+    #polling state for one station
+    __slots__ = ('crs', 'kwargs', 'priority', 'interval', 'activity', 'board', 'token')
+
+    def __init__(self, crs, kwargs, priority, interval):
+        self.crs = crs
+        self.kwargs = kwargs
+        self.priority = priority
+        self.interval = interval
+        #moving average of the fraction of polls which found a change
+        self.activity = 0.5
+        self.board = None
+        self.token = None
+
+def next_departure_in(board):
+    """
+    Return the number of seconds from when a board was generated until its next departure, or None if it has none
+    """
+    generated_at = board.generated_at
+    soonest = None
+    for services in (board.train_services, board.bus_services, board.ferry_services):
+        for service in services:
+            departure = service.estimated_departure or service.scheduled_departure
+            if departure is not None and departure >= generated_at and (soonest is None or departure < soonest):
+                soonest = departure
+    return None if soonest is None else (soonest - generated_at).total_seconds()
+
+class AdaptiveBoardPoller(object):
+    """
+    Polls the boards of many stations, refreshing each as often as it needs within a global request budget.
+
+    Each station's interval lies between min_interval and max_interval. It shortens as more polls of the station
+    find changes and lengthens while the board stays the same, is divided by the station's priority, and is
+    never much longer than the time until the station's next departure. Stations wait in a priority queue
+    ordered by when they are next due, so when the budget is tight the most overdue station is polled first.
+    """
+
+    def __init__(self, session, min_interval=15, max_interval=300, rate_limit=None, smoothing=0.3, clock=monotonic,
+            sleep=time.sleep):
+        """
+        Constructor
+
+        Positional arguments:
+        session -- the DarwinLdbSession (or SessionPool) to fetch boards with
+
+        Keyword arguments:
+        min_interval -- the shortest time in seconds between polls of one station (default 15)
+        max_interval -- the longest time in seconds between polls of one station (default 300)
+        rate_limit -- the maximum number of polls per second across all stations (default None, unlimited)
+        smoothing -- how strongly each poll moves a station's measured change rate, from 0 to 1 (default 0.3)
+        """
+        self._session = session
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._limiter = RateLimiter(rate_limit, clock=clock, sleep=sleep) if rate_limit else None
+        self._smoothing = smoothing
+        self._clock = clock
+        self._sleep = sleep
+        self._stations = {}
+        self._queue = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, crs, priority=1, **kwargs):
+        """
+        Start polling a station, at once.
+
+        Positional arguments:
+        crs -- the three letter CRS code of the station
+
+        Keyword arguments:
+        priority -- how much more often than normal to poll the station, e.g. 2 for twice as often (default 1)
+        Any other keyword arguments are passed to get_station_board
+
+        Raises ValueError unless priority is greater than zero
+        """
+        if not priority > 0:
+            raise ValueError("priority must be greater than zero, not %r" % (priority,))
+        crs = crs.upper()
+        with self._lock:
+            station = self._stations[crs] = _Station(crs, kwargs, priority, self._max_interval / float(priority))
+            self._schedule(station, self._clock())
+
+    def remove(self, crs):
+        """
+        Stop polling a station
+        """
+        with self._lock:
+            self._stations.pop(crs.upper(), None)
+
+    def interval(self, crs):
+        """
+        The number of seconds currently left between polls of a station
+        """
+        return self._stations[crs.upper()].interval
+
+    def _schedule(self, station, due):
+        station.token = next(self._counter)
+        heapq.heappush(self._queue, (due, station.token, station))
+
+    def _next_due(self):
+        #return the station due soonest and when, dropping queue entries for removed or rescheduled stations
+        while self._queue:
+            due, token, station = self._queue[0]
+            if self._stations.get(station.crs) is station and station.token == token:
+                return due, station
+            heapq.heappop(self._queue)
+        return None, None
+
+    def poll_once(self):
+        """
+        Wait until the next station is due, poll it and return a (crs, BoardDiff) tuple.
+
+        The BoardDiff is None if the poll failed, and false if nothing changed. Returns None if no stations are being polled.
+        """
+        while True:
+            with self._lock:
+                due, station = self._next_due()
+                if station is None:
+                    return None
+                wait = due - self._clock()
+                if wait <= 0:
+                    heapq.heappop(self._queue)
+                    break
+            self._sleep(wait)
+        if self._limiter:
+            self._limiter.acquire()
+        try:
+            try:
+                with background():
+                    board = self._session.get_station_board(station.crs, **station.kwargs)
+            except Exception:
+                #a WebServiceError, or e.g. a timeout from a session which doesn't wrap its transport's errors
+                log.warning("Polling the %s board failed, will retry in %s seconds", station.crs, station.interval,
+                    exc_info=True)
+                changes = None
+            else:
+                changes = diff_boards(station.board, board)
+                self._adapt(station, board, changes)
+                station.board = board
+        finally:
+            #the station was taken off the queue, it must go back on whatever happened
+            with self._lock:
+                if self._stations.get(station.crs) is station:
+                    self._schedule(station, self._clock() + station.interval)
+        return station.crs, changes
+
+    def _adapt(self, station, board, changes):
+        if station.board is not None:
+            station.activity += self._smoothing * ((1.0 if changes else 0.0) - station.activity)
+        interval = self._max_interval - (self._max_interval - self._min_interval) * station.activity
+        interval /= station.priority
+        next_departure = next_departure_in(board)
+        if next_departure is not None:
+            #look again around when the next train is due to leave
+            interval = min(interval, next_departure)
+        station.interval = max(self._min_interval, min(self._max_interval, interval))
+
+    def poll(self):
+        """
+        Poll stations as they fall due and yield a (crs, BoardDiff) tuple each time a board changes.
+
+        The first board fetched for each station is yielded as a diff in which every service is added. Polls
+        which fail are logged and retried later. The generator runs until the caller stops iterating or no stations
+        are left.
+        """
+        while True:
+            result = self.poll_once()
+            if result is None:
+                return
+            if result[1]:
+                yield result
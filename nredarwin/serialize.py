@@ -0,0 +1,68 @@
+from datetime import datetime
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def to_compact(model):
+    """
+    Return a response model as nested lists of values, without any keys.
+
+    Each object becomes a list of its field values in field_mapping order followed by its nested lists, as
+    declared by nested_fields. This is smaller and quicker to encode than to_dict, but can only be read back
+    by from_compact with the same model class and version of nredarwin.
+    """
+    values = []
+    for attribute, src_key in model._attribute_mapping():
+        value = getattr(model, attribute)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        values.append(value)
+    for attribute, name, model_class in model._nested_mapping():
+        items = model._materialized(attribute)
+        values.append([to_compact(item) for item in items] if model_class else list(items))
+    return values
+
+def from_compact(model_class, values, time_anchor=None):
+    """
+    Build a response model from lists returned by to_compact.
+
+    Positional arguments:
+    model_class -- the class of the serialized object, e.g. StationBoard
+    values -- the value returned by to_compact
+    """
+    count = len(model_class._attribute_mapping())
+    return model_class._rehydrate(values[:count], values[count:], time_anchor, from_compact)
+
+def dumps(model, binary=False):
+    """
+    Serialize a response model to bytes, for example to hold in Redis or memcached.
+
+    Keyword arguments:
+    binary -- if True, pack the compact form from to_compact with msgpack, which must be installed. Otherwise
+              encode to_dict as JSON (default False)
+    """
+    if binary:
+        if msgpack is None:
+            raise ImportError("msgpack is required for binary serialization, install nre-darwin-py[msgpack]")
+        return msgpack.packb(to_compact(model), use_bin_type=True)
+    return json.dumps(model.to_dict(), separators=(',', ':')).encode('utf-8')
+
+def loads(model_class, data, binary=False):
+    """
+    Build a response model from bytes returned by dumps.
+
+    Positional arguments:
+    model_class -- the class of the serialized object, e.g. StationBoard
+    data -- the bytes returned by dumps
+
+    Keyword arguments:
+    binary -- True if data was serialized with binary=True (default False)
+    """
+    if binary:
+        if msgpack is None:
+            raise ImportError("msgpack is required for binary serialization, install nre-darwin-py[msgpack]")
+        return from_compact(model_class, msgpack.unpackb(data, raw=False))
+    return model_class.from_dict(json.loads(data.decode('utf-8')))
@@ -0,0 +1,180 @@
+import heapq
+import multiprocessing
+import os
+import tempfile
+import time
+
+from nredarwin.ratelimit import BudgetScheduler, background, monotonic
+from nredarwin.serialize import from_compact, to_compact
+from nredarwin.webservice import DarwinLdbSession, StationBoard, WebServiceError
+
+#the session each worker process queries with, created by _init_worker
+_worker_session = None
+
+def _init_worker(session_factory, session_kwargs, rate_limit, rate_limit_file):
+    global _worker_session
+    session_kwargs = dict(session_kwargs)
+    if rate_limit:
+        #every worker draws on one budget, kept in a file they share
+        session_kwargs['scheduler'] = BudgetScheduler(rate_limit, state_file=rate_limit_file)
+    _worker_session = session_factory(**session_kwargs)
+
+def _fetch_chunk(task):
+    #fetch and build the boards of a chunk of stations, returning them in to_compact form so no SOAP objects are pickled
+    crs_codes, board_kwargs = task
+    results = []
+    for crs in crs_codes:
+        started = monotonic()
+        try:
+            with background():
+                board = _worker_session.get_station_board(crs, **board_kwargs)
+            compact, error = to_compact(board), None
+        except WebServiceError as e:
+            #sent back as its class and message, so a QueryError can still be told apart from a fault
+            compact, error = None, (type(e), str(e) or type(e).__name__)
+        except Exception as e:
+            #anything else, such as a timeout the session didn't wrap, is reported as a fault too rather than
+            #losing the rest of the round
+            compact, error = None, (WebServiceError, str(e) or type(e).__name__)
+        results.append((crs, monotonic() - started, compact, error))
+    return results
+
+def partition(costs, chunk_count):
+    """
+    Split stations into chunk_count lists with as even a total cost as possible, heaviest first.
+
+    Positional arguments:
+    costs -- a dict of the expected seconds to fetch each station's board, keyed on CRS code
+    chunk_count -- the number of lists to split into
+    """
+    chunks = [(0.0, i, []) for i in range(min(chunk_count, len(costs)))]
+    for crs in sorted(costs, key=lambda crs: (-costs[crs], crs)):
+        load, i, chunk = heapq.heappop(chunks)
+        chunk.append(crs)
+        heapq.heappush(chunks, (load + costs[crs], i, chunk))
+    return [chunk for load, i, chunk in sorted(chunks, reverse=True)]
+
+class ShardedBoardPoller(object):
+    """
+    Refreshes the boards of many stations across a pool of processes, so fetching and building them isn't limited
+    to a single core by the GIL.
+
+    Each worker process has its own session, and both fetches each board and builds its StationBoard. Boards are
+    passed back in the keyless to_compact form and rebuilt with from_compact, without parsing SOAP again; their
+    services are only rebuilt once they are read, and consumers which hand boards on elsewhere can take the
+    compact form itself by polling with compact=True. The stations are split into chunks of about equal expected
+    cost, based on a moving average of how long each station's board took to fetch, and chunks are handed to
+    workers as they become free, heaviest first, so a slow chunk or worker doesn't hold the rest up. Chunks are
+    drawn up afresh every round.
+    """
+
+    def __init__(self, crs_codes, processes=None, session_factory=DarwinLdbSession, session_kwargs=None,
+            chunks_per_process=4, smoothing=0.3, rate_limit=None, rate_limit_file=None, **board_kwargs):
+        """
+        Constructor
+
+        Positional arguments:
+        crs_codes -- an iterable of three letter CRS codes to poll
+
+        Keyword arguments:
+        processes -- the number of worker processes (default the number of CPUs)
+        session_factory -- a picklable callable each worker calls with session_kwargs to create its session (default DarwinLdbSession)
+        session_kwargs -- a dict of keyword arguments for session_factory, e.g. {'api_key': ..., 'engine': 'lite'}
+        chunks_per_process -- how many chunks each round is split into per process, more chunks balancing better (default 4)
+        smoothing -- how strongly each fetch moves a station's expected cost, from 0 to 1 (default 0.3)
+        rate_limit -- the maximum number of calls per second across all workers, enforced by a BudgetScheduler passed to
+                      session_factory as its scheduler keyword argument (default None, unlimited)
+        rate_limit_file -- a file in which workers share the rate limit, which may be shared with other pollers too
+                           (default a temporary file)
+        Any other keyword arguments are passed to get_station_board for every station
+        """
+        self._crs_codes = list(dict.fromkeys(crs.upper() for crs in crs_codes))
+        self._processes = processes or multiprocessing.cpu_count()
+        self._chunk_count = self._processes * chunks_per_process
+        self._smoothing = smoothing
+        self._board_kwargs = board_kwargs
+        self._costs = {}
+        self._own_rate_limit_file = None
+        if rate_limit and not rate_limit_file:
+            handle, rate_limit_file = tempfile.mkstemp(prefix='nredarwin-budget-')
+            os.close(handle)
+            self._own_rate_limit_file = rate_limit_file
+        self._pool = multiprocessing.Pool(self._processes, _init_worker,
+            (session_factory, session_kwargs or {}, rate_limit, rate_limit_file))
+
+    @property
+    def crs_codes(self):
+        """
+        The CRS codes being polled
+        """
+        return list(self._crs_codes)
+
+    def cost(self, crs):
+        """
+        The expected number of seconds to fetch a station's board, or None before it has been fetched
+        """
+        return self._costs.get(crs.upper())
+
+    def shards(self):
+        """
+        Return the chunks the next round will be split into, as lists of CRS codes
+        """
+        known = list(self._costs.values())
+        default = sum(known) / len(known) if known else 1.0
+        return partition(dict((crs, self._costs.get(crs, default)) for crs in self._crs_codes), self._chunk_count)
+
+    def poll_once(self, compact=False):
+        """
+        Fetch every station's board once, yielding (crs, result) tuples in the order they arrive, where result is
+        either a StationBoard or a WebServiceError saying why that station's query failed. Errors keep the
+        WebServiceError subclass the worker's session raised, such as QueryError for an invalid CRS code
+
+        Keyword arguments:
+        compact -- if True, yield each board in the to_compact form it arrives in rather than as a StationBoard,
+                   for from_compact to rebuild (default False)
+        """
+        tasks = [(chunk, self._board_kwargs) for chunk in self.shards()]
+        for results in self._pool.imap_unordered(_fetch_chunk, tasks):
+            for crs, seconds, values, error in results:
+                previous = self._costs.get(crs)
+                self._costs[crs] = seconds if previous is None else previous + self._smoothing * (seconds - previous)
+                if error is not None:
+                    error_class, message = error
+                    yield crs, error_class(message)
+                elif compact:
+                    yield crs, values
+                else:
+                    yield crs, from_compact(StationBoard, values)
+
+    def poll(self, interval=30, sleep=time.sleep, compact=False):
+        """
+        Poll every station once per interval seconds, yielding (crs, result) tuples as poll_once(compact) does. A
+        round which takes longer than interval is followed by the next at once. The generator runs until the caller
+        stops iterating.
+        """
+        while True:
+            started = monotonic()
+            for result in self.poll_once(compact):
+                yield result
+            remaining = interval - (monotonic() - started)
+            if remaining > 0:
+                sleep(remaining)
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        self._pool.terminate()
+        self._pool.join()
+        if self._own_rate_limit_file:
+            try:
+                os.remove(self._own_rate_limit_file)
+            except OSError:
+                pass
+            self._own_rate_limit_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta
+import bisect
+import heapq
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from nredarwin.serialize import from_compact, to_compact
+from nredarwin.webservice import StationBoard, _FixedOffset
+
+#each record in a log is its length followed by the zlib compressed JSON of the board's compact form
+_LENGTH = struct.Struct('<I')
+#an index starts with the most seconds any of its boards was appended after a later generated one
+_INDEX_HEADER = struct.Struct('<d')
+#each index entry is the board's generated_at as seconds since the epoch, its CRS code, the offset and length of
+#its record in the log, and the latest generated_at of any board appended up to and including it
+_INDEX_ENTRY = struct.Struct('<d4sQId')
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=_FixedOffset(0))
+
+def _timestamp(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=_EPOCH.tzinfo)
+    return (value - _EPOCH).total_seconds()
+
+def _segment_day(timestamp):
+    return (_EPOCH + timedelta(seconds=timestamp)).strftime('%Y-%m-%d')
+
+def _entry_position(i):
+    return _INDEX_HEADER.size + i * _INDEX_ENTRY.size
+
+class _IndexLatest(object):
+    #the latest generated_at up to each of a memory-mapped index's entries as a sequence, which never decreases,
+    #for bisect
+
+    def __init__(self, index, count):
+        self._index = index
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        return _INDEX_ENTRY.unpack_from(self._index, _entry_position(i))[4]
+
+class SnapshotStore(object):
+    """
+    An append-only archive of StationBoard snapshots on disk.
+
+    Boards are stored one UTC day per segment. Each segment is a log of length-prefixed, compressed records
+    (YYYY-MM-DD.log) and an index of fixed size entries giving the CRS code, generated_at time and position of
+    every record (YYYY-MM-DD.idx). Reads memory-map the index and log, so a time range can be streamed without
+    loading whole days into memory.
+
+    Boards may be appended in any order, as they are when fetched concurrently, and are read back in generated_at
+    order. Each index entry also holds the latest generated_at appended so far, and the index records how far
+    behind that any board has arrived, so reads binary-search for the start of a range, stop once no later entry
+    can fall inside it, and only hold back as many boards as arrived out of order.
+
+    Records are written before their index entry, so an interrupted append never leaves a readable but broken
+    snapshot behind. Appends are thread-safe, but only one process should write to a directory at a time.
+    """
+
+    def __init__(self, directory, compression_level=6):
+        """
+        Constructor
+
+        Positional arguments:
+        directory -- the directory holding the archive, created if necessary
+
+        Keyword arguments:
+        compression_level -- the zlib compression level for new records, 1 (fastest) to 9 (smallest) (default 6)
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+        self._compression_level = compression_level
+        self._segment = None
+        self._log = None
+        self._index = None
+        self._latest = None
+        self._lateness = 0.0
+        self._lock = threading.Lock()
+
+    def append(self, board):
+        """
+        Add a StationBoard to the archive. Raises ValueError if the board has no generated_at time
+        """
+        if board.generated_at is None:
+            raise ValueError("Cannot archive a board without a generated_at time")
+        timestamp = _timestamp(board.generated_at)
+        crs = (board.crs or '').upper().encode('ascii')
+        record = zlib.compress(json.dumps(to_compact(board), separators=(',', ':')).encode('utf-8'),
+            self._compression_level)
+        with self._lock:
+            self._open(_segment_day(timestamp))
+            latest = timestamp if self._latest is None else max(self._latest, timestamp)
+            if latest - timestamp > self._lateness:
+                #widen the window reads allow for before the entry which needs it is written
+                self._write_lateness(latest - timestamp)
+            self._log.seek(0, os.SEEK_END)
+            offset = self._log.tell() + _LENGTH.size
+            self._log.write(_LENGTH.pack(len(record)) + record)
+            self._log.flush()
+            self._index.write(_INDEX_ENTRY.pack(timestamp, crs, offset, len(record), latest))
+            self._index.flush()
+            self._latest = latest
+
+    def _open(self, segment):
+        if segment == self._segment:
+            return
+        self._close()
+        path = os.path.join(self._directory, segment) + '.idx'
+        self._latest = None
+        self._lateness = 0.0
+        if not os.path.exists(path) or os.path.getsize(path) < _INDEX_HEADER.size:
+            with open(path, 'wb') as fh:
+                fh.write(_INDEX_HEADER.pack(0.0))
+        else:
+            #carry on from the last whole entry of an existing index, dropping any partly written one
+            size = os.path.getsize(path)
+            count = (size - _INDEX_HEADER.size) // _INDEX_ENTRY.size
+            with open(path, 'r+b') as fh:
+                self._lateness = _INDEX_HEADER.unpack(fh.read(_INDEX_HEADER.size))[0]
+                if count:
+                    fh.seek(_entry_position(count - 1))
+                    self._latest = _INDEX_ENTRY.unpack(fh.read(_INDEX_ENTRY.size))[4]
+                if size != _entry_position(count):
+                    fh.truncate(_entry_position(count))
+        self._log = open(path[:-len('.idx')] + '.log', 'ab')
+        self._index = open(path, 'ab')
+        self._segment = segment
+
+    def _write_lateness(self, lateness):
+        with open(os.path.join(self._directory, self._segment) + '.idx', 'r+b') as fh:
+            fh.write(_INDEX_HEADER.pack(lateness))
+        self._lateness = lateness
+
+    def _close(self):
+        for fh in (self._log, self._index):
+            if fh is not None:
+                fh.close()
+        self._segment = self._log = self._index = self._latest = None
+        self._lateness = 0.0
+
+    def close(self):
+        """
+        Close the files being appended to
+        """
+        with self._lock:
+            self._close()
+
+    def segments(self):
+        """
+        Return the days held in the archive as a sorted list of YYYY-MM-DD strings
+        """
+        return sorted(name[:-len('.idx')] for name in os.listdir(self._directory) if name.endswith('.idx'))
+
+    def read(self, start=None, end=None, crs=None):
+        """
+        Iterate over archived boards in generated_at order, one at a time. Boards generated at the same time come in
+        the order they were appended.
+
+        Keyword arguments:
+        start -- only boards generated at or after this datetime
+        end -- only boards generated before this datetime
+        crs -- only boards for this CRS code, or any of an iterable of CRS codes
+        """
+        start_time = None if start is None else _timestamp(start)
+        end_time = None if end is None else _timestamp(end)
+        if crs is not None:
+            crs = set(code.upper().encode('ascii') for code in ([crs] if isinstance(crs, string_types) else crs))
+        for segment in self.segments():
+            #segments are whole UTC days, skip any wholly outside the range
+            if start_time is not None and segment < _segment_day(start_time):
+                continue
+            if end_time is not None and segment > _segment_day(end_time):
+                break
+            for board in self._read_segment(segment, start_time, end_time, crs):
+                yield board
+
+    def _read_segment(self, segment, start_time, end_time, crs):
+        path = os.path.join(self._directory, segment)
+        with open(path + '.idx', 'rb') as index_fh, open(path + '.log', 'rb') as log_fh:
+            index_size = os.fstat(index_fh.fileno()).st_size
+            #ignore a partly written trailing entry
+            count = max(0, index_size - _INDEX_HEADER.size) // _INDEX_ENTRY.size
+            if not count or not os.fstat(log_fh.fileno()).st_size:
+                return
+            index = mmap.mmap(index_fh.fileno(), 0, access=mmap.ACCESS_READ)
+            log = mmap.mmap(log_fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                lateness = _INDEX_HEADER.unpack_from(index, 0)[0]
+                #every entry before the first whose latest time reaches start was generated before start
+                first = 0 if start_time is None else bisect.bisect_left(_IndexLatest(index, count), start_time)
+                #(generated_at, position, offset, length) of boards read but which a later entry may precede
+                pending = []
+                for i in range(first, count):
+                    timestamp, code, offset, length, latest = _INDEX_ENTRY.unpack_from(index, _entry_position(i))
+                    #no board from here on was generated before latest - lateness
+                    if end_time is not None and latest - lateness >= end_time:
+                        break
+                    if not ((start_time is not None and timestamp < start_time) or
+                            (end_time is not None and timestamp >= end_time) or
+                            (crs is not None and code.rstrip(b'\0') not in crs)):
+                        heapq.heappush(pending, (timestamp, i, offset, length))
+                    while pending and pending[0][0] <= latest - lateness:
+                        yield self._board(log, *heapq.heappop(pending)[2:])
+                while pending:
+                    yield self._board(log, *heapq.heappop(pending)[2:])
+            finally:
+                index.close()
+                log.close()
+
+    def _board(self, log, offset, length):
+        record = zlib.decompress(log[offset:offset + length])
+        return from_compact(StationBoard, json.loads(record.decode('utf-8')))
@@ -0,0 +1,76 @@
+from datetime import timedelta
+import re
+
+_TIME_RE = re.compile(r'^(\d\d):(\d\d)$')
+
+#a time more than this far either side of the anchor is taken to be on the neighbouring day
+_ROLLOVER = timedelta(hours=12)
+
+#the estimated or actual time Darwin gives for a service running to schedule
+ON_TIME = 'On time'
+
+class DarwinTimeParser(object):
+    """
+    Converts the human readable times in LDB responses into timezone-aware datetimes.
+
+    Darwin gives times as "HH:MM" strings in UK local time, or as status words such as "On time", "Delayed" or
+    "Cancelled". Times are anchored on the date and UTC offset of an anchor datetime, normally the generated_at
+    time of the response, and moved to the previous or next day when they lie more than 12 hours from it so
+    boards spanning midnight come out right. Results are memoized, so one parser can cheaply be shared by every
+    time on a board.
+    """
+
+    def __init__(self, anchor):
+        """
+        Constructor
+
+        Positional arguments:
+        anchor -- a datetime close to the times being parsed, usually the generated_at time of the response
+        """
+        self._anchor = anchor
+        self._memo = {}
+
+    @property
+    def anchor(self):
+        """
+        The datetime times are anchored on
+        """
+        return self._anchor
+
+    def parse(self, value, scheduled=None):
+        """
+        Return value as a datetime, or None if it isn't a time.
+
+        Positional arguments:
+        value -- a Darwin time string, such as an std or etd
+
+        Keyword arguments:
+        scheduled -- the scheduled time string that value is an estimate or actual for. If given, "On time" is
+                     taken to mean this time
+        """
+        if value == ON_TIME:
+            value = scheduled
+        if value is None or self._anchor is None:
+            return None
+        try:
+            return self._memo[value]
+        except KeyError:
+            parsed = self._memo[value] = self._to_datetime(value)
+            return parsed
+
+    def _to_datetime(self, value):
+        match = _TIME_RE.match(value)
+        if not match:
+            #Delayed, Cancelled, No report and the like
+            return None
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            return None
+        anchor = self._anchor
+        parsed = anchor.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        offset = parsed - anchor
+        if offset > _ROLLOVER:
+            parsed -= timedelta(days=1)
+        elif offset < -_ROLLOVER:
+            parsed += timedelta(days=1)
+        return parsed
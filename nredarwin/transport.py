@@ -0,0 +1,246 @@
+import base64
+import logging
+import socket
+import threading
+import time
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import unquote, urlsplit
+    from urllib.request import getproxies, proxy_bypass
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib import getproxies, proxy_bypass, unquote
+    from urlparse import urlsplit
+
+from nredarwin.ratelimit import monotonic
+
+log = logging.getLogger(__name__)
+
+#statuses worth retrying, the LDB Webservice sits behind load balancers which produce these during restarts
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+#connections to each host in a pool by default. Every session in the process shares the default pool, so this leaves
+#room for an AsyncDarwinLdbSession's max_concurrency, bulk queries' workers and a prefetcher's workers at once
+DEFAULT_CONNECTIONS = 32
+
+class HttpError(IOError):
+    """
+    An unexpected HTTP status from the LDB Webservice
+    """
+
+    def __init__(self, status, reason=None, body=None):
+        super(HttpError, self).__init__("HTTP %s %s" % (status, reason or ''))
+        self.status = status
+        self.body = body
+
+class _StaleConnection(Exception):
+    #a kept-alive connection which the server had already closed, retried at once on a fresh connection
+
+    def __init__(self, error):
+        super(_StaleConnection, self).__init__(str(error))
+        self.error = error
+
+class PooledHttpTransport(object):
+    """
+    A thread-safe pool of keep-alive HTTP and HTTPS connections.
+
+    Connections are reused between calls, so sustained polling doesn't pay for a TCP and TLS handshake on every
+    request. The number of simultaneous connections to each host is capped, and requests failing with connection
+    errors or 502, 503 and 504 responses are retried with exponential backoff. Timeouts are not retried. Time spent
+    waiting for a connection counts towards a request's timeout, and raises socket.timeout if none becomes free.
+
+    Like urllib, requests go through the proxies given by the HTTP_PROXY and HTTPS_PROXY environment variables,
+    except for hosts in NO_PROXY. HTTPS requests are tunnelled through the proxy with CONNECT. The environment is
+    read the first time each host is used.
+
+    Instances can be given to DarwinLdbSession and LiteSoapEngine as their transport.
+    """
+
+    def __init__(self, pool_size=DEFAULT_CONNECTIONS, per_host=DEFAULT_CONNECTIONS, retries=2, backoff=0.1, timeout=5,
+            sleep=time.sleep):
+        """
+        Constructor
+
+        Keyword arguments:
+        pool_size -- the maximum number of idle connections kept open across all hosts (default DEFAULT_CONNECTIONS)
+        per_host -- the maximum number of connections open to any one host at once, further requests wait. Should be
+                    at least the number of calls the sessions using the pool make in parallel (default DEFAULT_CONNECTIONS)
+        retries -- the number of times a failed request is retried (default 2)
+        backoff -- seconds to wait before the first retry, doubling for each subsequent one (default 0.1)
+        timeout -- a timeout in seconds for requests which don't give their own (default 5)
+        """
+        self._pool_size = pool_size
+        self._per_host = per_host
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+        self._sleep = sleep
+        self._idle = {}
+        self._idle_count = 0
+        self._in_use = {}
+        self._proxies = {}
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Make an HTTP request and return a (status, headers, body) tuple
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        proxy = self._proxy(key)
+        if proxy is not None and parts.scheme == 'http':
+            #a plain HTTP proxy is sent the whole URL
+            path = '%s://%s%s' % (parts.scheme, parts.netloc, path)
+            headers = _with_proxy_auth(headers, proxy)
+        timeout = self._timeout if timeout is None else timeout
+        attempt = 0
+        while True:
+            try:
+                status, response_headers, data = self._request_once(key, method, path, body, headers or {}, timeout)
+            except _StaleConnection as e:
+                log.debug("Kept-alive connection to %s was closed (%s), reconnecting", parts.hostname, e)
+                continue
+            except socket.timeout:
+                raise
+            except (socket.error, HTTPException) as e:
+                if attempt >= self._retries:
+                    raise
+                log.warning("Request to %s failed (%s), retrying", parts.hostname, e)
+            else:
+                if status not in RETRY_STATUSES or attempt >= self._retries:
+                    return status, response_headers, data
+                log.warning("Request to %s returned %s, retrying", parts.hostname, status)
+            self._sleep(self._backoff * (2 ** attempt))
+            attempt += 1
+
+    def __call__(self, url, body, headers, timeout=None):
+        """
+        POST a SOAP request and return the response body, as expected by LiteSoapEngine.
+
+        SOAP faults arrive with a 500 status and are returned for the engine to parse, other error statuses
+        raise HttpError.
+        """
+        status, response_headers, data = self.request('POST', url, body, headers, timeout)
+        if status in (200, 500):
+            return data
+        raise HttpError(status, body=data)
+
+    def _checkout(self, key, timeout):
+        #wait up to timeout seconds for a connection slot, returning (connection, reused, remaining timeout)
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._lock:
+            while self._in_use.get(key, 0) >= self._per_host:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise socket.timeout("timed out waiting for a connection to %s" % key[1])
+                self._slot_freed.wait(remaining)
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            idle = self._idle.get(key)
+            if idle:
+                self._idle_count -= 1
+                connection, reused = idle.pop(), True
+            else:
+                connection, reused = None, False
+        if connection is None:
+            connection = self._connect(key)
+        if deadline is not None:
+            timeout = max(deadline - monotonic(), 0.001)
+        return connection, reused, timeout
+
+    def _proxy(self, key):
+        #the split URL of the proxy for requests to key's host, or None to connect directly
+        try:
+            return self._proxies[key]
+        except KeyError:
+            pass
+        scheme, host, port = key
+        proxy = None if proxy_bypass(host) else getproxies().get(scheme)
+        if proxy:
+            if '://' not in proxy:
+                proxy = 'http://' + proxy
+            proxy = urlsplit(proxy)
+        else:
+            proxy = None
+        with self._lock:
+            return self._proxies.setdefault(key, proxy)
+
+    def _connect(self, key):
+        scheme, host, port = key
+        proxy = self._proxy(key)
+        if proxy is None:
+            connection_class = HTTPSConnection if scheme == 'https' else HTTPConnection
+            return connection_class(host, port)
+        if scheme == 'https':
+            connection = HTTPSConnection(proxy.hostname, proxy.port)
+            connection.set_tunnel(host, port, _with_proxy_auth({}, proxy))
+            return connection
+        return HTTPConnection(proxy.hostname, proxy.port)
+
+    def _checkin(self, key, connection, reusable):
+        with self._lock:
+            if reusable and self._idle_count < self._pool_size:
+                self._idle.setdefault(key, []).append(connection)
+                self._idle_count += 1
+                connection = None
+            self._in_use[key] -= 1
+            self._slot_freed.notify_all()
+        if connection is not None:
+            connection.close()
+
+    def _request_once(self, key, method, path, body, headers, timeout):
+        connection, reused, timeout = self._checkout(key, timeout)
+        reusable = False
+        try:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+            except socket.timeout:
+                raise
+            except (socket.error, HTTPException) as e:
+                if reused:
+                    raise _StaleConnection(e)
+                raise
+            data = response.read()
+            reusable = not response.will_close
+            return response.status, dict(response.getheaders()), data
+        finally:
+            self._checkin(key, connection, reusable)
+
+    def close(self):
+        """
+        Close every idle connection
+        """
+        with self._lock:
+            idle, self._idle, self._idle_count = self._idle, {}, 0
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+def _with_proxy_auth(headers, proxy):
+    #headers with a Proxy-Authorization header added if the proxy URL carries credentials
+    if proxy.username is None:
+        return headers
+    credentials = '%s:%s' % (unquote(proxy.username), unquote(proxy.password or ''))
+    headers = dict(headers)
+    headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+    return headers
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def default_http_pool():
+    """
+    The PooledHttpTransport shared by sessions which aren't given one
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = PooledHttpTransport()
+        return _default_pool
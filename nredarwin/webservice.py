@@ -1,43 +1,85 @@
-from suds.client import Client
+from suds.cache import ObjectCache
+from suds.client import Client, ServiceSelector
+from suds.options import Options
+from suds.properties import Unskin
 from suds.sax.element import Element
+from suds.transport import Reply, TransportError
+from suds.transport.http import HttpTransport
 from suds import WebFault
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, tzinfo
 from functools import partial
+from io import BytesIO
+import copy
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape
+import hashlib
 import logging
 import os
+import re
+import tempfile
+import threading
+import time
+from nredarwin.cache import query_key
+from nredarwin.diff import diff_boards
+from nredarwin.metrics import CallMetrics, active_call, recording
+from nredarwin.ratelimit import RateLimiter, background, monotonic
+from nredarwin.times import DarwinTimeParser
+from nredarwin.transport import default_http_pool
+try:
+    from http.client import HTTPException
+    from urllib.request import Request, urlopen, pathname2url
+    from urllib.error import HTTPError
+except ImportError:
+    from httplib import HTTPException
+    from urllib2 import Request, urlopen, HTTPError
+    from urllib import pathname2url
+try:
+    from xml.etree.ElementTree import ParseError
+except ImportError:
+    from xml.parsers.expat import ExpatError as ParseError
 
 log = logging.getLogger(__name__)
 #TODO - timeouts and error handling
 DARWIN_WEBSERVICE_NAMESPACE = ('com','http://thalesgroup.com/RTTI/2010-11-01/ldb/commontypes')
-
-class DarwinLdbSession(object):
+#used by the lite engine, which talks to the service without reading the WSDL
+DARWIN_LDB_ENDPOINT = 'https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb6.asmx'
+DARWIN_LDB_NAMESPACE = 'http://thalesgroup.com/RTTI/2014-02-20/ldb/'
+DARWIN_LDB_SOAP_ACTION = 'http://thalesgroup.com/RTTI/2012-01-13/ldb/%s'
+#how long in seconds the WSDL and its schemas are cached on disk before being fetched again, 0 caches forever
+DEFAULT_WSDL_CACHE_TTL = 24 * 60 * 60
+#the live LDB Webservice WSDL, used by the suds engine when no other is configured
+DARWIN_LDB_WSDL = 'https://lite.realtime.nationalrail.co.uk/OpenLDBWS/wsdl.aspx?ver=2014-02-20'
+#a trimmed copy of the LDB Webservice WSDL shipped with the package, used when no other WSDL can be had
+BUNDLED_WSDL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ldb-wsdl.xml')
+#errors from transports when the webservice can't be reached or doesn't answer, raised by engines as WebServiceError
+TRANSPORT_ERRORS = (IOError, OSError, HTTPException, TransportError)
+#fault strings of client faults which are about the account rather than the query, e.g. an exceeded quota
+_ACCOUNT_FAULT = re.compile(r'token|quota|limit|exceeded|unauthori[sz]ed|forbidden', re.IGNORECASE)
+
+class SessionBase(object):
     """
-    A connection to the Darwin LDB web service
+    The query methods of a session, all answered through its _cached_query(model_class, operation, **params) method.
+
+    DarwinLdbSession answers queries by calling the webservice. Sessions which pass queries on to other sessions,
+    such as SessionPool, subclass this and implement _cached_query, giving them the same methods as DarwinLdbSession.
     """
 
-    def __init__(self, wsdl=None, api_key=None, timeout=5):
-        """
-        Constructor
+    def _cached_query(self, model_class, operation, **params):
+        raise NotImplementedError
 
-        Keyword arguments:
-        wsdl -- the URL of the Darwin LDB WSDL document. Will fall back to using the DARWIN_WEBSERVICE_WSDL environment variable if not supplied
-        api_key -- a valid API key for the Darwin LDB webservice. Will fall back to the DARWIN_WEBSERVICE_API_KEY if not supplied
-        timeout -- a timeout in seconds for calls to the LDB Webservice (default 5)
+    def query_operation(self, model_class, operation, **params):
         """
-        if not wsdl:
-            wsdl = os.environ['DARWIN_WEBSERVICE_WSDL']
-        if not api_key:
-            api_key = os.environ['DARWIN_WEBSERVICE_API_KEY']
-        self._soap_client = Client(wsdl)
-        self._soap_client.set_options(timeout=timeout)
-        #build soap headers
-        token3 = Element('AccessToken', ns=DARWIN_WEBSERVICE_NAMESPACE)
-        token_value = Element('TokenValue', ns=DARWIN_WEBSERVICE_NAMESPACE)
-        token_value.setText(api_key)
-        token3.append(token_value)
-        self._soap_client.set_options(soapheaders=(token3))
+        Make a query given as an LDB Webservice operation and its own parameters, and return a model_class instance.
+        The query goes through the session like those of the other methods.
 
-    def _base_query(self):
-        return self._soap_client.service['LDBServiceSoap']
+        Positional arguments:
+        model_class -- the response model to build, StationBoard or ServiceDetails
+        operation -- the name of the operation, e.g. GetDepartureBoard
+
+        Any keyword arguments are the operation's parameters, e.g. crs='MAN', numRows=10
+        """
+        return self._cached_query(model_class, operation, **params)
 
     def get_station_board(self, crs, rows=10, include_departures=True, include_arrivals=False, destination_crs=None, origin_crs=None):
         """
@@ -62,21 +104,16 @@ class DarwinLdbSession(object):
             query_type = 'GetArrivalBoard'
         else:
             raise ValueError("get_station_board must have either include_departures or include_arrivals set to True")
-        #build a query function
-        q = partial(self._base_query()[query_type], crs=crs, numRows=rows)
+        #build the query parameters
+        params = {'crs': crs, 'numRows': rows}
         if destination_crs:
             if origin_crs:
                 log.warn("Station board query can only filter on one of destination_crs and origin_crs, using only destination_crs")
-            q = partial(q, filterCrs=destination_crs, filterType='to')
+            params.update(filterCrs=destination_crs, filterType='to')
         elif origin_crs:
-            q = partial(q, filterCrs=origin_crs, filterType='from')
-        try:
-            soap_response = q()
-        except WebFault:
-            raise WebServiceError
-        return StationBoard(soap_response)
+            params.update(filterCrs=origin_crs, filterType='from')
+        return self._cached_query(StationBoard, query_type, **params)
 
-    
     def get_service_details(self, service_id):
         """
         Get the details of an individual service and return a ServiceDetails instance.
@@ -84,25 +121,953 @@ class DarwinLdbSession(object):
         Positional arguments:
         service_id: A Darwin LDB service id
         """
+        return self._cached_query(ServiceDetails, 'GetServiceDetails', serviceID=service_id)
+
+    def get_station_boards(self, crs_codes, workers=8, rate_limit=None, **kwargs):
+        """
+        Query the darwin webservice for the boards of many stations concurrently.
+
+        Returns a generator yielding (crs, result) tuples in the order the queries complete, where result is
+        either a StationBoard or the exception raised for that station, normally a WebServiceError. Duplicate CRS codes
+        are only queried once.
+
+        Positional arguments:
+        crs_codes -- an iterable of three letter CRS codes
+
+        Keyword arguments:
+        workers -- the number of queries to run in parallel (default 8)
+        rate_limit -- the maximum number of queries to start per second (default None, unlimited)
+        Any other keyword arguments are passed to get_station_board for every station
+        """
+        return self._fan_out(partial(self.get_station_board, **kwargs), crs_codes, workers, rate_limit)
+
+    def get_service_details_many(self, service_ids, workers=8, rate_limit=None):
+        """
+        Get the details of many services concurrently.
+
+        Returns a generator yielding (service_id, result) tuples in the order the queries complete, where result is
+        either a ServiceDetails or the exception raised for that service, normally a WebServiceError. Duplicate ids
+        are only queried once.
+
+        Positional arguments:
+        service_ids -- an iterable of Darwin LDB service ids
+
+        Keyword arguments:
+        workers -- the number of queries to run in parallel (default 8)
+        rate_limit -- the maximum number of queries to start per second (default None, unlimited)
+        """
+        return self._fan_out(self.get_service_details, service_ids, workers, rate_limit)
+
+    def poll_station_board(self, crs, interval=30, sleep=time.sleep, **kwargs):
+        """
+        Repeatedly query the board for a station and yield a nredarwin.diff.BoardDiff each time it changes.
+
+        The first board fetched is yielded as a diff in which every service is added. Polls which fail are logged
+        and skipped. The generator runs until the caller stops iterating.
+
+        Positional arguments:
+        crs -- the three letter CRS code of a UK station
+
+        Keyword arguments:
+        interval -- seconds to wait between polls (default 30)
+        Any other keyword arguments are passed to get_station_board
+        """
+        previous = None
+        while True:
+            try:
+                with background():
+                    board = self.get_station_board(crs, **kwargs)
+            except Exception:
+                #a WebServiceError, or e.g. a timeout from a session which doesn't wrap its transport's errors
+                log.warning("Polling the %s board failed, will retry in %s seconds", crs, interval, exc_info=True)
+            else:
+                changes = diff_boards(previous, board)
+                previous = board
+                if changes:
+                    yield changes
+            sleep(interval)
+
+    def _fan_out(self, query, keys, workers, rate_limit):
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        def fetch(key):
+            if limiter:
+                limiter.acquire()
+            try:
+                with background():
+                    return query(key)
+            except Exception as e:
+                #one failed query mustn't lose the results of the others
+                return e
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {}
+        try:
+            seen = set()
+            for key in keys:
+                if key not in seen:
+                    seen.add(key)
+                    futures[executor.submit(fetch, key)] = key
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            #if the caller stops iterating early don't leave queued queries behind
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+class DarwinLdbSession(SessionBase):
+    """
+    A connection to the Darwin LDB web service
+    """
+
+    def __init__(self, wsdl=None, api_key=None, timeout=5, engine='suds', endpoint=None, wsdl_cache_dir=None,
+            wsdl_cache_ttl=DEFAULT_WSDL_CACHE_TTL, share_client=True, cache=None, http_pool=None, instrument=None,
+            scheduler=None):
+        """
+        Constructor
+
+        Keyword arguments:
+        wsdl -- the URL of the Darwin LDB WSDL document. Will fall back to using the DARWIN_WEBSERVICE_WSDL environment variable,
+                then the live WSDL (DARWIN_LDB_WSDL) if not supplied. If the WSDL can't be fetched and isn't cached, the copy
+                bundled with the package (BUNDLED_WSDL) is used instead
+        api_key -- a valid API key for the Darwin LDB webservice. Will fall back to the DARWIN_WEBSERVICE_API_KEY if not supplied
+        timeout -- a timeout in seconds for calls to the LDB Webservice (default 5)
+        engine -- 'suds' to drive the webservice through its WSDL with suds (the default), 'lite' to use the faster LiteSoapEngine,
+                  or an engine instance with a call(operation, **params) method
+        endpoint -- the URL of the LDB Webservice used by the lite engine. Will fall back to the DARWIN_WEBSERVICE_ENDPOINT environment
+                    variable, then DARWIN_LDB_ENDPOINT if not supplied
+        wsdl_cache_dir -- a directory in which the suds engine keeps the WSDL, its schemas and the parsed client between processes.
+                          Will fall back to the DARWIN_WEBSERVICE_CACHE_DIR environment variable, then a directory under the system temp dir
+        wsdl_cache_ttl -- how long in seconds cached WSDL documents are used before being fetched again, 0 to never refetch (default one day).
+                          If the WSDL can't be fetched an expired copy is used instead
+        share_client -- share one parsed suds client between all sessions using the same WSDL in this process (default True)
+        cache -- a nredarwin.cache.ResponseCache, or any object with a get_or_load(key, loader) method, used to answer repeated
+                 queries without calling the webservice (default None, no caching)
+        http_pool -- a nredarwin.transport.PooledHttpTransport holding keep-alive connections to the webservice. Defaults to a pool
+                     shared by every session in the process
+        instrument -- a callable given a nredarwin.metrics.CallMetrics after every query, such as a nredarwin.metrics.MetricsCollector
+                      (default None, no instrumentation)
+        scheduler -- a nredarwin.ratelimit.BudgetScheduler, shared by every session using the same API key, which each call to the
+                     webservice waits on so the key's quota isn't exceeded (default None)
+        """
+        if not api_key:
+            api_key = os.environ['DARWIN_WEBSERVICE_API_KEY']
+        http_pool = http_pool or default_http_pool()
+        if engine == 'suds':
+            if not wsdl:
+                wsdl = os.environ.get('DARWIN_WEBSERVICE_WSDL') or DARWIN_LDB_WSDL
+            engine = SudsEngine(wsdl, api_key, timeout=timeout, cache_dir=wsdl_cache_dir, cache_ttl=wsdl_cache_ttl,
+                share_client=share_client, http_pool=http_pool)
+        elif engine == 'lite':
+            endpoint = endpoint or os.environ.get('DARWIN_WEBSERVICE_ENDPOINT', DARWIN_LDB_ENDPOINT)
+            engine = LiteSoapEngine(api_key, endpoint=endpoint, timeout=timeout, transport=http_pool)
+        elif not hasattr(engine, 'call'):
+            raise ValueError("Unknown Darwin LDB engine %r" % (engine,))
+        self._engine = engine
+        self._cache = cache
+        self._instrument = instrument
+        self._scheduler = scheduler
+
+    @property
+    def engine(self):
+        """
+        The engine used to make SOAP calls to the LDB Webservice
+        """
+        return self._engine
+
+    @property
+    def cache(self):
+        """
+        The response cache used by this session, or None
+        """
+        return self._cache
+
+    @property
+    def instrument(self):
+        """
+        The callable given a CallMetrics after every query, or None
+        """
+        return self._instrument
+
+    @property
+    def scheduler(self):
+        """
+        The BudgetScheduler calls to the webservice wait on, or None
+        """
+        return self._scheduler
+
+    def _query(self, operation, **params):
+        return self._engine.call(operation, **params)
+
+    def _fetch(self, operation, params):
+        #call the webservice, within the scheduler's budget if there is one
+        scheduler = self._scheduler
+        if scheduler is None:
+            return self._query(operation, **params)
+        metrics = active_call()
+        started = monotonic()
+        scheduler.acquire()
+        if metrics is not None:
+            metrics.queued = monotonic() - started
+        try:
+            response = self._query(operation, **params)
+        except QueryError:
+            #the webservice answered, the query itself was wrong
+            raise
+        except WebServiceError:
+            scheduler.record_fault()
+            raise
+        scheduler.record_success()
+        return response
+
+    def _cached_query(self, model_class, operation, **params):
+        #fetch and build a response model, going through the cache if there is one
+        if self._instrument is not None:
+            return self._instrumented_query(model_class, operation, params)
+        load = lambda: model_class(self._fetch(operation, params))
+        if self._cache is None:
+            return load()
+        return self._cache.get_or_load(query_key(operation, **params), load)
+
+    def _instrumented_query(self, model_class, operation, params):
+        metrics = CallMetrics(operation)
+
+        def load():
+            if metrics.cache_hit:
+                metrics.cache_hit = False
+            started = monotonic()
+            with recording(metrics):
+                response = self._fetch(operation, params)
+            fetched = monotonic()
+            metrics.unmarshal = fetched - started - metrics.queued - metrics.network
+            model = model_class(response)
+            metrics.build = monotonic() - fetched
+            return model
+
+        started = monotonic()
+        try:
+            if self._cache is None:
+                return load()
+            metrics.cache_hit = True
+            return self._cache.get_or_load(query_key(operation, **params), load)
+        except WebServiceError:
+            metrics.fault = True
+            raise
+        except Exception as e:
+            metrics.error = type(e).__name__
+            raise
+        finally:
+            metrics.total = monotonic() - started
+            try:
+                self._instrument(metrics)
+            except Exception:
+                log.exception("Instrumentation callback failed")
+
+def default_wsdl_cache_dir():
+    """
+    The directory used to cache WSDL documents when none is given
+    """
+    return os.environ.get('DARWIN_WEBSERVICE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'nredarwin-wsdl-cache')
+
+class WsdlCacheTransport(HttpTransport):
+    """
+    A suds transport which keeps WSDL and schema documents in a persistent on-disk cache.
+
+    Documents younger than ttl seconds are read from disk without touching the network. Older documents
+    are fetched again, but are still used if the fetch fails so a WSDL host outage doesn't stop new sessions.
+    """
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_WSDL_CACHE_TTL, **kwargs):
+        HttpTransport.__init__(self, **kwargs)
+        self.cache_dir = cache_dir or default_wsdl_cache_dir()
+        self.ttl = ttl
+
+    def open(self, request):
+        url = request.url
+        if not url.startswith(('http:', 'https:')):
+            return HttpTransport.open(self, request)
+        path = os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.xml')
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            age = None
+        if age is not None and (not self.ttl or age < self.ttl):
+            return self._load(path)
+        try:
+            data = self._fetch(request)
+        except Exception:
+            if age is None:
+                raise
+            log.warning("Could not fetch %s, using a cached copy from %d seconds ago", url, age)
+            return self._load(path)
+        self._store(path, data)
+        return BytesIO(data)
+
+    def _load(self, path):
+        with open(path, 'rb') as fh:
+            return BytesIO(fh.read())
+
+    def _fetch(self, request):
+        fp = HttpTransport.open(self, request)
+        try:
+            return fp.read()
+        finally:
+            fp.close()
+
+    def _store(self, path, data):
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            #write then rename, so concurrent processes never read a partial document
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp_path, 'wb') as fh:
+                fh.write(data)
+            getattr(os, 'replace', os.rename)(tmp_path, path)
+        except (IOError, OSError):
+            log.warning("Could not write WSDL cache file %s", path, exc_info=True)
+
+    def __deepcopy__(self, memo={}):
+        clone = HttpTransport.__deepcopy__(self, memo)
+        clone.cache_dir = self.cache_dir
+        clone.ttl = self.ttl
+        return clone
+
+class PooledSudsTransport(WsdlCacheTransport):
+    """
+    A suds transport sending SOAP requests over a PooledHttpTransport's keep-alive connections,
+    and reading the WSDL through the WsdlCacheTransport cache
+    """
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_WSDL_CACHE_TTL, pool=None, **kwargs):
+        WsdlCacheTransport.__init__(self, cache_dir=cache_dir, ttl=ttl, **kwargs)
+        self.pool = pool or default_http_pool()
+
+    def send(self, request):
+        metrics = active_call()
+        started = monotonic()
+        #suds leaves the request's timeout unset, as its own transports do use the client's
+        timeout = request.timeout if request.timeout is not None else self.options.timeout
+        status, headers, body = self.pool.request('POST', request.url, request.message, request.headers, timeout)
+        if metrics is not None:
+            metrics.add_network(monotonic() - started, len(request.message), len(body))
+        if status == 500:
+            #suds reads SOAP faults from the error's body
+            raise TransportError("HTTP %s" % status, status, BytesIO(body))
+        if status != 200:
+            #suds would turn any other status into a bare Exception
+            raise WebServiceError("Calling the LDB Webservice failed: HTTP %s" % status)
+        return Reply(status, headers, body)
+
+    def __deepcopy__(self, memo={}):
+        clone = WsdlCacheTransport.__deepcopy__(self, memo)
+        #every copy shares the same connections
+        clone.pool = self.pool
+        return clone
+
+def _wsdl_url(wsdl):
+    #allow a local copy of the WSDL to be given as a plain file path
+    if os.path.isfile(wsdl):
+        return 'file:' + pathname2url(os.path.abspath(wsdl))
+    return wsdl
+
+def build_wsdl_client(wsdl, cache_dir=None, cache_ttl=DEFAULT_WSDL_CACHE_TTL):
+    """
+    Build a suds Client for the WSDL at wsdl, caching the documents and the parsed client on disk.
+
+    If the WSDL can't be fetched and there is no cached copy, the client is built from BUNDLED_WSDL instead
+    """
+    cache_dir = cache_dir or default_wsdl_cache_dir()
+    #suds ties a transport to the options of a single client, so each attempt needs its own
+    build = lambda url: Client(url, cache=ObjectCache(location=os.path.join(cache_dir, 'objects'), seconds=cache_ttl),
+        transport=WsdlCacheTransport(cache_dir=cache_dir, ttl=cache_ttl))
+    try:
+        return build(_wsdl_url(wsdl))
+    except TRANSPORT_ERRORS:
+        if wsdl == BUNDLED_WSDL:
+            raise
+        log.warning("Could not fetch the WSDL at %s, using the bundled copy", wsdl, exc_info=True)
+        return build(_wsdl_url(BUNDLED_WSDL))
+
+def clone_wsdl_client(client):
+    """
+    Return a copy of a suds Client which shares its parsed WSDL but can be given its own options
+    """
+    #Client.clone deep copies the options, which recurses forever with some suds and python versions.
+    #Option values are only ever replaced rather than modified, so a shallow copy is enough apart from
+    #the transport, which suds links to a single set of options
+    options = dict(Unskin(client.options).defined)
+    options['transport'] = copy.deepcopy(client.options.transport)
+    clone = copy.copy(client)
+    clone.options = Options()
+    Unskin(clone.options).update(options)
+    clone.service = ServiceSelector(clone, client.wsdl.services)
+    clone.messages = dict(tx=None, rx=None)
+    return clone
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+def shared_wsdl_client(wsdl, cache_dir=None, cache_ttl=DEFAULT_WSDL_CACHE_TTL):
+    """
+    Return a suds Client for the WSDL at wsdl, built only once per process for each set of arguments.
+
+    The shared client must not be modified, sessions take a clone_wsdl_client copy and set their own options.
+    """
+    key = (wsdl, cache_dir, cache_ttl)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = build_wsdl_client(wsdl, cache_dir=cache_dir, cache_ttl=cache_ttl)
+            _shared_clients[key] = client
+        return client
+
+def clear_shared_wsdl_clients():
+    """
+    Forget all shared suds clients, so the next session re-reads its WSDL
+    """
+    with _shared_clients_lock:
+        _shared_clients.clear()
+
+class SudsEngine(object):
+    """
+    Makes calls to the LDB Webservice with suds, driven by the service WSDL
+    """
+
+    def __init__(self, wsdl, api_key, timeout=5, cache_dir=None, cache_ttl=DEFAULT_WSDL_CACHE_TTL, share_client=True, http_pool=None):
+        if share_client:
+            self._soap_client = clone_wsdl_client(shared_wsdl_client(wsdl, cache_dir=cache_dir, cache_ttl=cache_ttl))
+        else:
+            self._soap_client = build_wsdl_client(wsdl, cache_dir=cache_dir, cache_ttl=cache_ttl)
+        transport = PooledSudsTransport(cache_dir=cache_dir, ttl=cache_ttl, pool=http_pool, timeout=timeout)
+        self._soap_client.set_options(timeout=timeout, transport=transport)
+        #build soap headers
+        token3 = Element('AccessToken', ns=DARWIN_WEBSERVICE_NAMESPACE)
+        token_value = Element('TokenValue', ns=DARWIN_WEBSERVICE_NAMESPACE)
+        token_value.setText(api_key)
+        token3.append(token_value)
+        self._soap_client.set_options(soapheaders=(token3))
+        self._local = threading.local()
+
+    def _thread_client(self):
+        #suds clients aren't safe to share between threads, so each thread gets a cheap clone sharing the parsed WSDL
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = clone_wsdl_client(self._soap_client)
+            self._local.client = client
+        return client
+
+    def _base_query(self):
+        return self._thread_client().service['LDBServiceSoap']
+
+    def call(self, operation, **params):
+        """
+        Call an LDB Webservice operation and return the suds response object
+        """
+        try:
+            return self._base_query()[operation](**params)
+        except WebFault as e:
+            fault = getattr(e, 'fault', None)
+            raise fault_error(getattr(fault, 'faultcode', None), getattr(fault, 'faultstring', None))
+        except TRANSPORT_ERRORS as e:
+            raise WebServiceError("Calling the LDB Webservice failed: %s" % (e or type(e).__name__))
+
+class LiteSoapEngine(object):
+    """
+    Makes calls to the LDB Webservice without suds.
+
+    Request envelopes are built from templates and responses are parsed with a streaming XML parser into
+    lightweight SoapObjects, which the model classes read in the same way as suds response objects.
+    """
+
+    envelope_template = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns:com="%(token_ns)s" xmlns:ldb="%(ldb_ns)s">'
+        '<soap:Header><com:AccessToken><com:TokenValue>%(api_key)s</com:TokenValue></com:AccessToken></soap:Header>'
+        '<soap:Body><ldb:%(request)s>%(params)s</ldb:%(request)s></soap:Body>'
+        '</soap:Envelope>'
+    )
+
+    #request parameters for each operation, in the order the schema demands
+    operations = {
+        'GetDepartureBoard': ('GetDepartureBoardRequest', ('numRows', 'crs', 'filterCrs', 'filterType', 'timeOffset', 'timeWindow')),
+        'GetArrivalBoard': ('GetArrivalBoardRequest', ('numRows', 'crs', 'filterCrs', 'filterType', 'timeOffset', 'timeWindow')),
+        'GetArrivalDepartureBoard': ('GetArrivalDepartureBoardRequest', ('numRows', 'crs', 'filterCrs', 'filterType', 'timeOffset', 'timeWindow')),
+        'GetServiceDetails': ('GetServiceDetailsRequest', ('serviceID',)),
+    }
+
+    def __init__(self, api_key, endpoint=DARWIN_LDB_ENDPOINT, timeout=5, namespace=DARWIN_LDB_NAMESPACE, transport=None):
+        """
+        Constructor
+
+        Positional arguments:
+        api_key -- a valid API key for the Darwin LDB webservice
+
+        Keyword arguments:
+        endpoint -- the URL of the LDB Webservice (default DARWIN_LDB_ENDPOINT)
+        timeout -- a timeout in seconds for calls to the LDB Webservice (default 5)
+        namespace -- the namespace of the LDB Webservice version at endpoint (default DARWIN_LDB_NAMESPACE)
+        transport -- a callable taking (url, body, headers, timeout) and returning the response body, such as http_post or a
+                     nredarwin.transport.PooledHttpTransport. Defaults to the shared keep-alive connection pool
+        """
+        self._api_key = api_key
+        self._endpoint = endpoint
+        self._timeout = timeout
+        self._namespace = namespace
+        self._transport = transport or default_http_pool()
+
+    def build_envelope(self, operation, **params):
+        """
+        Build the SOAP request envelope for an operation, returned as UTF-8 encoded bytes
+        """
+        try:
+            request, param_names = self.operations[operation]
+        except KeyError:
+            raise ValueError("LiteSoapEngine does not support the %s operation" % operation)
+        unknown = set(params) - set(param_names)
+        if unknown:
+            raise ValueError("Unknown parameters for %s: %s" % (operation, ", ".join(sorted(unknown))))
+        param_xml = "".join(
+            "<ldb:%s>%s</ldb:%s>" % (name, escape(str(params[name])), name)
+            for name in param_names if params.get(name) is not None
+        )
+        envelope = self.envelope_template % {
+            'token_ns': DARWIN_WEBSERVICE_NAMESPACE[1],
+            'ldb_ns': self._namespace,
+            'api_key': escape(self._api_key),
+            'request': request,
+            'params': param_xml,
+        }
+        return envelope.encode('utf-8')
+
+    def call(self, operation, **params):
+        """
+        Call an LDB Webservice operation and return the parsed response as a SoapObject
+        """
+        body = self.build_envelope(operation, **params)
+        headers = {
+            'Content-Type': 'text/xml; charset=utf-8',
+            'SOAPAction': '"%s"' % (DARWIN_LDB_SOAP_ACTION % operation),
+        }
+        metrics = active_call()
+        started = monotonic()
         try:
-            soap_response = self._soap_client.service['LDBServiceSoap']['GetServiceDetails'](serviceID=service_id)
-        except WebFault:
-            raise WebServiceError
-        return ServiceDetails(soap_response)
+            response = self._transport(self._endpoint, body, headers, self._timeout)
+        except HTTPError as e:
+            #SOAP faults arrive with a 500 status, the body still describes the fault
+            response = e.read()
+        except TRANSPORT_ERRORS as e:
+            raise WebServiceError("Calling the LDB Webservice failed: %s" % (e or type(e).__name__))
+        if metrics is not None:
+            metrics.add_network(monotonic() - started, len(body), len(response))
+        try:
+            return parse_soap_response(response)
+        except ParseError:
+            #for example an HTML error page from a load balancer
+            raise WebServiceError("Malformed response from the LDB Webservice")
+
+def http_post(url, body, headers, timeout):
+    """
+    POST body to url and return the response body
+    """
+    response = urlopen(Request(url, body, headers), timeout=timeout)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+class SoapObject(object):
+    """
+    A plain attribute container standing in for a suds response object
+    """
+
+    def __repr__(self):
+        return "SoapObject(%s)" % ", ".join("%s=%r" % item for item in sorted(self.__dict__.items()))
+
+class _FixedOffset(tzinfo):
+    #datetime.timezone is not available on python 2
+
+    def __init__(self, minutes):
+        self._minutes = minutes
+        self._offset = timedelta(minutes=minutes)
+
+    def __getinitargs__(self):
+        return (self._minutes,)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return None
+
+_DATETIME_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)?$')
+
+def _parse_datetime(text):
+    match = _DATETIME_RE.match(text)
+    if not match:
+        return text
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    tz = None
+    if zone == 'Z':
+        tz = _FixedOffset(0)
+    elif zone:
+        minutes = int(zone[1:3]) * 60 + int(zone[4:6])
+        tz = _FixedOffset(-minutes if zone[0] == '-' else minutes)
+    value = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), tzinfo=tz)
+    if fraction:
+        #Darwin sends up to 7 fractional digits, round to the nearest microsecond
+        value += timedelta(microseconds=int(round(float('0.' + fraction) * 1000000)))
+    return value
+
+def _parse_boolean(text):
+    return text in ('true', '1')
+
+#value conversions for simple typed elements and attributes, everything else is left as text
+_SOAP_CONVERTERS = {
+    'generatedAt': _parse_datetime,
+    'isCircularRoute': _parse_boolean,
+    'isCancelled': _parse_boolean,
+    'platformAvailable': _parse_boolean,
+    'areServicesAvailable': _parse_boolean,
+    'serviceChangeRequired': _parse_boolean,
+    'assocIsCancelled': _parse_boolean,
+}
+
+#elements which may occur more than once, these always become lists as they do with suds
+_SOAP_LIST_ELEMENTS = frozenset([
+    'service', 'location', 'message', 'callingPointList', 'callingPoint', 'adhocAlertText',
+])
+
+_XSI_NIL = '{http://www.w3.org/2001/XMLSchema-instance}nil'
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _soap_value(elem, built):
+    name = _local_name(elem.tag)
+    if elem.get(_XSI_NIL) == 'true':
+        return None
+    if len(elem) == 0 and not elem.attrib:
+        if not elem.text:
+            return None
+        convert = _SOAP_CONVERTERS.get(name)
+        return convert(elem.text) if convert else elem.text
+    obj = SoapObject()
+    for key, text in elem.attrib.items():
+        key = _local_name(key)
+        convert = _SOAP_CONVERTERS.get(key)
+        #suds exposes xml attributes with a leading underscore
+        setattr(obj, '_' + key, convert(text) if convert else text)
+    for child in elem:
+        child_name = _local_name(child.tag)
+        value = built.pop(child)
+        if child_name in _SOAP_LIST_ELEMENTS:
+            obj.__dict__.setdefault(child_name, []).append(value)
+        else:
+            setattr(obj, child_name, value)
+    return obj
+
+def fault_error(faultcode, faultstring):
+    """
+    Return the exception to raise for a SOAP fault: a QueryError for a client fault about the query itself, such
+    as an invalid CRS code or unknown service ID, otherwise a WebServiceError
+    """
+    message = faultstring or "SOAP fault"
+    if (faultcode or '').rpartition(':')[2] == 'Client' and not _ACCOUNT_FAULT.search(message):
+        return QueryError(message)
+    return WebServiceError(message)
+
+def parse_soap_response(source):
+    """
+    Parse an LDB Webservice SOAP response and return the result it contains as a SoapObject.
+
+    Raises WebServiceError (or QueryError, see fault_error) if the response is a SOAP fault
+
+    Positional arguments:
+    source -- the response as bytes or a binary file-like object
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    #Envelope is at level 0, Body at 1, the operation response (or fault) at 2 and its result at 3
+    level = 0
+    in_body = False
+    built = {}
+    results = []
+    for event, elem in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if level == 1:
+                in_body = _local_name(elem.tag) == 'Body'
+            level += 1
+            continue
+        level -= 1
+        if not in_body or level < 2:
+            continue
+        if level == 2:
+            if _local_name(elem.tag) == 'Fault':
+                fault = dict(results)
+                raise fault_error(fault.get('faultcode'), fault.get('faultstring'))
+            continue
+        value = _soap_value(elem, built)
+        if level == 3:
+            results.append((_local_name(elem.tag), value))
+        else:
+            built[elem] = value
+        elem.clear()
+    if not results:
+        raise WebServiceError("Empty response from the LDB Webservice")
+    return results[0][1]
+
+def _field_slots(field_mapping, base=None):
+    #__slots__ for a response model, one attribute per field_mapping entry not already provided by base
+    inherited = set()
+    for klass in (base.__mro__ if base else ()):
+        inherited.update(getattr(klass, '__slots__', ()))
+    return tuple('_' + dest_key for dest_key, src_key in field_mapping if '_' + dest_key not in inherited)
+
+#(attribute, soap key) pairs for each response model class, built on first use
+_attribute_mappings = {}
+#(attribute, name, model class) triples for the nested lists of each response model class, built on first use
+_nested_mappings = {}
+
+class _LazyList(object):
+    #stands in for a list of models until it is first needed, holding the SOAP data to build it from
+    __slots__ = ('build', 'args')
+
+    def __init__(self, build, *args):
+        self.build = build
+        self.args = args
+
+    def materialize(self):
+        return self.build(*self.args)
+
+def _rebuild_list(build, model_class, items, time_anchor):
+    #build the objects of a nested list held in serialized form
+    return [build(model_class, item, time_anchor) for item in items]
 
 class SoapResponseBase(object):
+    """
+    Base class for the response models.
+
+    Models are populated from a SOAP response according to their field_mapping, and use __slots__ derived from it
+    rather than a per-instance __dict__ to keep large numbers of them cheap to hold in memory.
+    """
+    __slots__ = ()
+
+    #(property, model class name) for each list held by a model besides its field_mapping, which to_dict and
+    #from_dict include. A class name of None marks a list of plain values
+    nested_fields = []
 
     def __init__(self, soap_response):
-        for dest_key, src_key in self.__class__.field_mapping:
-            try:
-                val = getattr(soap_response, src_key)
-            except AttributeError:
-                val = None
-            setattr(self, '_' + dest_key, val)
+        for attribute, src_key in self._attribute_mapping():
+            setattr(self, attribute, getattr(soap_response, src_key, None))
+
+    def to_dict(self):
+        """
+        Return this object as a dict of builtins, including its nested lists of objects, ready for json.dumps.
+
+        Keys are the property names from field_mapping and nested_fields. generated_at becomes an ISO 8601 string.
+        The result can be turned back into an object by from_dict without parsing any SOAP.
+        """
+        data = {}
+        for attribute, src_key in self._attribute_mapping():
+            value = getattr(self, attribute)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            data[attribute[1:]] = value
+        for attribute, name, model_class in self._nested_mapping():
+            values = self._materialized(attribute)
+            data[name] = [value.to_dict() for value in values] if model_class else list(values)
+        return data
+
+    @classmethod
+    def from_dict(cls, data, time_anchor=None):
+        """
+        Build an object from a dict returned by to_dict.
+
+        Positional arguments:
+        data -- a dict as returned by to_dict, or decoded from its JSON
+
+        Keyword arguments:
+        time_anchor -- the datetime times are anchored on, for objects without a generated_at of their own
+        """
+        return cls._rehydrate([data.get(attribute[1:]) for attribute, src_key in cls._attribute_mapping()],
+            [data.get(name) for attribute, name, model_class in cls._nested_mapping()], time_anchor,
+            lambda model_class, value, anchor: model_class.from_dict(value, anchor))
+
+    @classmethod
+    def _rehydrate(cls, values, nested, time_anchor, build):
+        #build an object from its field values in field_mapping order and its nested lists, bypassing __init__.
+        #build(model class, serialized value, time anchor) turns each nested value back into an object
+        self = cls.__new__(cls)
+        for (attribute, src_key), value in zip(cls._attribute_mapping(), values):
+            setattr(self, attribute, value)
+        generated_at = getattr(self, '_generated_at', None)
+        if generated_at is not None and not isinstance(generated_at, datetime):
+            self._generated_at = generated_at = _parse_datetime(generated_at)
+        if time_anchor is None:
+            time_anchor = generated_at
+        self._restore_times(time_anchor)
+        for (attribute, name, model_class), items in zip(cls._nested_mapping(), nested):
+            items = items or []
+            if model_class:
+                #like lists parsed from SOAP, nested objects are only built once they are read
+                setattr(self, attribute, _LazyList(_rebuild_list, build, model_class, items, time_anchor))
+            else:
+                setattr(self, attribute, list(items))
+        return self
+
+    def _restore_times(self, time_anchor):
+        pass
+
+    def _materialized(self, attribute):
+        #return the list held in attribute, building it first if it is still a _LazyList
+        value = getattr(self, attribute)
+        if isinstance(value, _LazyList):
+            value = value.materialize()
+            setattr(self, attribute, value)
+        return value
+
+    def __getstate__(self):
+        #pickle slot values, building any lazy lists so pickles never hold raw SOAP data
+        state = {}
+        for klass in type(self).__mro__:
+            for slot in getattr(klass, '__slots__', ()):
+                try:
+                    value = getattr(self, slot)
+                except AttributeError:
+                    continue
+                state[slot] = value.materialize() if isinstance(value, _LazyList) else value
+        return (None, state)
+
+    def __copy__(self):
+        #copy slot values as they are, so lists which haven't been built yet are left for the copy to build
+        copied = type(self).__new__(type(self))
+        for klass in type(self).__mro__:
+            for slot in getattr(klass, '__slots__', ()):
+                try:
+                    setattr(copied, slot, getattr(self, slot))
+                except AttributeError:
+                    continue
+        return copied
+
+    @classmethod
+    def _attribute_mapping(cls):
+        try:
+            return _attribute_mappings[cls]
+        except KeyError:
+            mapping = _attribute_mappings[cls] = [('_' + dest_key, src_key) for dest_key, src_key in cls.field_mapping]
+            return mapping
+
+    @classmethod
+    def _nested_mapping(cls):
+        try:
+            return _nested_mappings[cls]
+        except KeyError:
+            mapping = _nested_mappings[cls] = [('_' + name, name, globals()[class_name] if class_name else None)
+                for name, class_name in cls.nested_fields]
+            return mapping
 
-        
+class TimedResponseBase(SoapResponseBase):
+    """
+    Base class for response models carrying Darwin times, which can be read as datetimes as well as strings.
+
+    Times are parsed by a DarwinTimeParser anchored on the generated_at time of the response they came from.
+    All the times on an object are parsed together the first time one is read, and kept.
+    """
+
+    #(datetime property, time string property, scheduled time string property) for each parsed time
+    time_fields = []
+
+    __slots__ = ('_time_anchor', '_parsed_times')
 
-class StationBoard(SoapResponseBase):
+    def __init__(self, soap_response, time_anchor=None):
+        super(TimedResponseBase, self).__init__(soap_response)
+        self._time_anchor = time_anchor
+        self._parsed_times = None
+
+    def _restore_times(self, time_anchor):
+        self._time_anchor = time_anchor
+        self._parsed_times = None
+
+    def inflate_times(self, parser=None):
+        """
+        Parse every time on this object now rather than on first access, and return the object.
+
+        Keyword arguments:
+        parser -- a DarwinTimeParser to use, so its memoized results can be shared with other objects
+        """
+        if parser is None:
+            parser = DarwinTimeParser(self._time_anchor)
+        times = {}
+        for name, src, scheduled_src in self.time_fields:
+            scheduled = getattr(self, scheduled_src) if scheduled_src else None
+            times[name] = parser.parse(getattr(self, src), scheduled)
+        self._parsed_times = times
+        return self
+
+    def _time(self, name):
+        if self._parsed_times is None:
+            self.inflate_times()
+        return self._parsed_times[name]
+
+#columns read from each service row by StationBoard.to_columns, and where to find them on raw SOAP rows and ServiceItems
+_ROW_COLUMNS = ('service_id', 'std', 'etd', 'platform', 'operator_code')
+_RAW_COLUMN_FIELDS = {'service_id': 'serviceID', 'std': 'std', 'etd': 'etd', 'platform': 'platform', 'operator_code': 'operatorCode'}
+_MODEL_COLUMN_FIELDS = dict((name, name) for name in _ROW_COLUMNS)
+
+def _delay_minutes(parser, scheduled, estimated):
+    scheduled_time = parser.parse(scheduled)
+    estimated_time = parser.parse(estimated, scheduled)
+    if scheduled_time is None or estimated_time is None:
+        return None
+    return int((estimated_time - scheduled_time).total_seconds() // 60)
+
+def boards_to_columns(boards, columns=None):
+    """
+    Return the services on many boards as a single dict of equal length lists, one per column.
+
+    See StationBoard.to_columns for the available columns.
+
+    Positional arguments:
+    boards -- an iterable of StationBoard objects
+
+    Keyword arguments:
+    columns -- the names of the columns to include (default all of them)
+    """
+    columns = tuple(columns or StationBoard.columns)
+    output = dict((name, []) for name in columns)
+    for board in boards:
+        for name, values in board.to_columns(columns).items():
+            output[name].extend(values)
+    return output
+
+class _FreshnessMixin(object):
+    #staleness of the top level responses, which a ResilientSession may serve after the webservice has failed
+    __slots__ = ()
+
+    @property
+    def is_stale(self):
+        """
+        True if this response was served from an earlier call because the webservice couldn't be reached
+        """
+        return getattr(self, '_stale', False)
+
+    def age(self, now=None):
+        """
+        Return the time since the response was generated as a timedelta, or None if that isn't known.
+
+        Keyword arguments:
+        now -- the current time as a timezone-aware datetime (default the time now)
+        """
+        generated_at = self._generated_at
+        if not isinstance(generated_at, datetime):
+            return None
+        return (now or datetime.now(generated_at.tzinfo)) - generated_at
+
+class StationBoard(_FreshnessMixin, SoapResponseBase):
     """
     An abstract representation of a station departure board
     """
@@ -119,9 +1084,22 @@ class StationBoard(SoapResponseBase):
         ('ferry_services', 'ferryServices')
     ]
 
+    nested_fields = [
+        ('train_services', 'ServiceItem'),
+        ('bus_services', 'ServiceItem'),
+        ('ferry_services', 'ServiceItem'),
+        ('nrcc_messages', None),
+    ]
+
+    __slots__ = _field_slots(field_mapping + service_lists) + ('_nrcc_messages', '_stale')
+
+    #the columns produced by to_columns, in order
+    columns = ('crs', 'service_type', 'service_id', 'std', 'etd', 'platform', 'operator_code', 'delay_minutes')
+
     def __init__(self, soap_response, *args, **kwargs):
         super(StationBoard,self).__init__(soap_response, *args, **kwargs)
         #populate service lists - these are specific to station board objects, so not included in base class
+        #ServiceItems are only built when a list is first read, to_columns can work from the SOAP data directly
         for dest_key, src_key in self.__class__.service_lists:
             try:
                 service_rows = getattr(getattr(soap_response, src_key), 'service')
@@ -129,7 +1107,7 @@ class StationBoard(SoapResponseBase):
                 setattr(self, '_' + dest_key, [])
                 continue
 
-            setattr(self, '_' + dest_key, [ServiceItem(s) for s  in service_rows])
+            setattr(self, '_' + dest_key, _LazyList(self._service_items, service_rows, self._generated_at))
         #populate nrcc_messages
         if hasattr(soap_response, 'nrccMessages') and hasattr(soap_response.nrccMessages, 'message'):
             #TODO - would be nice to strip HTML from these, especially as it's not compliant with modern standards
@@ -137,6 +1115,50 @@ class StationBoard(SoapResponseBase):
         else:
             self._nrcc_messages = []
 
+    @staticmethod
+    def _service_items(service_rows, time_anchor):
+        return [ServiceItem(s, time_anchor=time_anchor) for s in service_rows]
+
+    def to_columns(self, columns=None):
+        """
+        Return the services on this board as a dict of equal length lists, one per column, ready to be handed to
+        pandas.DataFrame, numpy or similar.
+
+        Columns are read straight from the response where the service lists haven't been used yet, without building
+        ServiceItem objects. The available columns are listed in StationBoard.columns: the board's CRS code, the service
+        type (train, bus or ferry), service_id, std, etd, platform, operator_code and delay_minutes, which is the
+        difference between the estimated and scheduled departure or None when either isn't a time.
+
+        Keyword arguments:
+        columns -- the names of the columns to include (default all of them)
+        """
+        columns = tuple(columns or self.columns)
+        unknown = set(columns) - set(self.columns)
+        if unknown:
+            raise ValueError("Unknown columns: %s" % ", ".join(sorted(unknown)))
+        output = dict((name, []) for name in columns)
+        parser = DarwinTimeParser(self._generated_at) if 'delay_minutes' in columns else None
+        for dest_key, src_key in self.__class__.service_lists:
+            services = getattr(self, '_' + dest_key)
+            if isinstance(services, _LazyList) and services.build is StationBoard._service_items:
+                rows, field_names = services.args[0], _RAW_COLUMN_FIELDS
+            else:
+                #built already, or held in serialized form by a board from from_dict or from_compact
+                rows, field_names = self._materialized('_' + dest_key), _MODEL_COLUMN_FIELDS
+            appenders = [(output[name].append, field_names[name]) for name in columns if name in field_names]
+            for row in rows:
+                for append, field_name in appenders:
+                    append(getattr(row, field_name, None))
+            if 'crs' in output:
+                output['crs'].extend([self._crs] * len(rows))
+            if 'service_type' in output:
+                output['service_type'].extend([dest_key.split('_')[0]] * len(rows))
+            if parser is not None:
+                std, etd = field_names['std'], field_names['etd']
+                output['delay_minutes'].extend(
+                    _delay_minutes(parser, getattr(row, std, None), getattr(row, etd, None)) for row in rows)
+        return output
+
     @property
     def generated_at(self):
         """
@@ -163,21 +1185,21 @@ class StationBoard(SoapResponseBase):
         """
         A list of train services that appear on this board. Empty if there are none
         """
-        return self._train_services
+        return self._materialized('_train_services')
 
     @property
     def bus_services(self):
         """
         A list of bus services that appear on this board. Empty if there are none
         """
-        return self._bus_services
+        return self._materialized('_bus_services')
 
     @property
     def ferry_services(self):
         """
         A list of ferry services that appear on this board. Empty if there are none
         """
-        return self._ferry_services
+        return self._materialized('_ferry_services')
 
     @property
     def nrcc_messages(self):
@@ -185,10 +1207,22 @@ class StationBoard(SoapResponseBase):
         An optional list of important messages that should be displayed with the station board. Messages may include HTML hyperlinks and paragraphs.        """
         return self._nrcc_messages
 
+    def inflate_times(self):
+        """
+        Parse the times of every service on the board in one pass, sharing a single DarwinTimeParser, and return the board.
+
+        Times are otherwise parsed service by service as they are read.
+        """
+        parser = DarwinTimeParser(self._generated_at)
+        for services in (self.train_services, self.bus_services, self.ferry_services):
+            for service in services:
+                service.inflate_times(parser)
+        return self
+
     def __str__(self):
         return "%s - %s" % (self.crs, self.location_name)
 
-class ServiceDetailsBase(SoapResponseBase):
+class ServiceDetailsBase(TimedResponseBase):
     #The generic stuff that both service details classes have
     field_mapping = [
         ('sta', 'sta'),
@@ -200,22 +1234,46 @@ class ServiceDetailsBase(SoapResponseBase):
         ('operator_code', 'operatorCode'),
     ]
 
+    time_fields = [
+        ('scheduled_arrival', 'sta', None),
+        ('estimated_arrival', 'eta', 'sta'),
+        ('scheduled_departure', 'std', None),
+        ('estimated_departure', 'etd', 'std'),
+    ]
+
+    __slots__ = _field_slots(field_mapping)
 
     @property
     def scheduled_arrival(self):
-        raise NotImplementedError()
+        """
+        The sta (Scheduled Time of Arrival) as a timezone-aware datetime, or None
+        """
+        return self._time('scheduled_arrival')
 
     @property
     def estimated_arrival(self):
-        raise NotImplementedError()
-        
+        """
+        The eta (Estimated Time of Arrival) as a timezone-aware datetime.
+
+        None if there is no eta or it isn't a time, for example "Delayed" or "Cancelled"
+        """
+        return self._time('estimated_arrival')
+
     @property
     def scheduled_departure(self):
-        raise NotImplementedError()
+        """
+        The std (Scheduled Time of Departure) as a timezone-aware datetime, or None
+        """
+        return self._time('scheduled_departure')
 
     @property
     def estimated_departure(self):
-        raise NotImplementedError()
+        """
+        The etd (Estimated Time of Departure) as a timezone-aware datetime.
+
+        None if there is no etd or it isn't a time, for example "Delayed" or "Cancelled"
+        """
+        return self._time('estimated_departure')
 
     @property
     def sta(self):
@@ -274,7 +1332,7 @@ class ServiceDetailsBase(SoapResponseBase):
         """
         return self._operator_code
 
-    #TODO -Adhoc alerts, datetime inflators - if possible
+    #TODO -Adhoc alerts
 
 class ServiceItem(ServiceDetailsBase):
     """
@@ -285,6 +1343,13 @@ class ServiceItem(ServiceDetailsBase):
         ('is_circular_route', 'isCircularRoute'),
         ('service_id', 'serviceID'),
     ]
+
+    nested_fields = [
+        ('origins', 'ServiceLocation'),
+        ('destinations', 'ServiceLocation'),
+    ]
+
+    __slots__ = _field_slots(field_mapping, ServiceDetailsBase) + ('_origins', '_destinations')
     
     def __init__(self, soap_data, *args, **kwargs):
         super(ServiceItem, self).__init__(soap_data, *args, **kwargs)
@@ -312,14 +1377,14 @@ class ServiceItem(ServiceDetailsBase):
         """
         A list of ServiceLocation objects describing the origins of this service. A service may have more than multiple origins.
         """
-        return self._origins
+        return self._materialized('_origins')
 
     @property
     def destinations(self):
         """
         A list of ServiceLocation objects describing the destinations of this service. A service may have more than multiple destinations.
         """
-        return self._destinations
+        return self._materialized('_destinations')
 
     @property
     def destination_text(self):
@@ -335,6 +1400,13 @@ class ServiceItem(ServiceDetailsBase):
         """
         return self._location_formatter(self.origins)
 
+    @property
+    def is_cancelled(self):
+        """
+        True if the estimated arrival or departure of this service at the station is "Cancelled"
+        """
+        return self._etd == 'Cancelled' or self._eta == 'Cancelled'
+
     def _location_formatter(self, location_list):
         return ", ".join([str(l) for l in location_list])
 
@@ -352,6 +1424,8 @@ class ServiceLocation(SoapResponseBase):
         ('via', 'via'),
         ('future_change_to', 'futureChangeTo')
     ]
+
+    __slots__ = _field_slots(field_mapping)
     
     @property
     def location_name(self):
@@ -387,7 +1461,7 @@ class ServiceLocation(SoapResponseBase):
         else:
             return self.location_name
 
-class ServiceDetails(ServiceDetailsBase):
+class ServiceDetails(_FreshnessMixin, ServiceDetailsBase):
     """
     In depth details of a single service
     """
@@ -402,22 +1476,71 @@ class ServiceDetails(ServiceDetailsBase):
         ('crs', 'crs'),
         ('generated_at', 'generatedAt'),
     ]
-   
+
+    time_fields = ServiceDetailsBase.time_fields + [
+        ('actual_arrival', 'ata', 'sta'),
+        ('actual_departure', 'atd', 'std'),
+    ]
+
+    nested_fields = [
+        ('previous_calling_point_lists', 'CallingPointList'),
+        ('subsequent_calling_point_lists', 'CallingPointList'),
+    ]
+
+    __slots__ = _field_slots(field_mapping, ServiceDetailsBase) + (
+        '_previous_calling_point_lists', '_subsequent_calling_point_lists',
+        '_previous_calling_points', '_subsequent_calling_points', '_stale',
+    )
+
     def __init__(self, soap_data, *args, **kwargs):
         super(ServiceDetails, self).__init__(soap_data, *args, **kwargs)
-        self._previous_calling_point_lists = self._calling_point_lists(soap_data, 'previousCallingPoints')
-        self._subsequent_calling_point_lists = self._calling_point_lists(soap_data, 'subsequentCallingPoints')
-
-    def _calling_point_lists(self, soap_data, src_key):
+        if self._time_anchor is None:
+            self._time_anchor = self._generated_at
+        #calling points are only built when first asked for, many callers only need the fields above
+        self._previous_calling_point_lists = _LazyList(self._calling_point_lists,
+            getattr(soap_data, 'previousCallingPoints', None), self._time_anchor)
+        self._subsequent_calling_point_lists = _LazyList(self._calling_point_lists,
+            getattr(soap_data, 'subsequentCallingPoints', None), self._time_anchor)
+
+    @staticmethod
+    def _calling_point_lists(soap_data, time_anchor):
         try:
-            calling_points = getattr(getattr(soap_data, src_key), 'callingPointList')
+            calling_points = getattr(soap_data, 'callingPointList')
         except AttributeError:
             return []
         lists = []
         for sublist in calling_points:
-            lists.append(CallingPointList(sublist))
+            lists.append(CallingPointList(sublist, time_anchor=time_anchor))
         return lists
 
+    def inflate_times(self, parser=None):
+        """
+        Parse every time on this service and all its calling points in one pass, and return the service.
+
+        Keyword arguments:
+        parser -- a DarwinTimeParser to use, so its memoized results can be shared with other objects
+        """
+        if parser is None:
+            parser = DarwinTimeParser(self._time_anchor)
+        super(ServiceDetails, self).inflate_times(parser)
+        for calling_point in self.previous_calling_points + self.subsequent_calling_points:
+            calling_point.inflate_times(parser)
+        return self
+
+    @property
+    def actual_arrival(self):
+        """
+        The ata (Actual Time of Arrival) as a timezone-aware datetime, or None
+        """
+        return self._time('actual_arrival')
+
+    @property
+    def actual_departure(self):
+        """
+        The atd (Actual Time of Departure) as a timezone-aware datetime, or None
+        """
+        return self._time('actual_departure')
+
     @property
     def is_cancelled(self):
         """
@@ -491,7 +1614,7 @@ class ServiceDetails(ServiceDetailsBase):
         containing the calling points of associated trains which join the through train from their
         respective origins through to the calling point at which they join with the through train.
         """
-        return self._previous_calling_point_lists
+        return self._materialized('_previous_calling_point_lists')
 
     @property
     def subsequent_calling_point_lists(self):
@@ -503,7 +1626,7 @@ class ServiceDetails(ServiceDetailsBase):
         calling points of associated trains which split from the through train from the calling
         point at which they split off from the through train until their respective destinations.
         """
-        return self._subsequent_calling_point_lists
+        return self._materialized('_subsequent_calling_point_lists')
 
     @property
     def previous_calling_points(self):
@@ -511,9 +1634,14 @@ class ServiceDetails(ServiceDetailsBase):
         A list of CallingPoint objects.
 
         This is the list of all previous calling points for the service, including all associated
-        services if multiple services join together to form this service.
+        services if multiple services join together to form this service. It is built on first access
+        and the same list is returned afterwards.
         """
-        return [cp for cpl in self._previous_calling_point_lists for cp in cpl.calling_points]
+        try:
+            return self._previous_calling_points
+        except AttributeError:
+            self._previous_calling_points = [cp for cpl in self.previous_calling_point_lists for cp in cpl.calling_points]
+            return self._previous_calling_points
 
     @property
     def subsequent_calling_points(self):
@@ -521,11 +1649,16 @@ class ServiceDetails(ServiceDetailsBase):
         A list of CallingPoint objects.
 
         This is the list of all subsequent calling points for the service, including all associated
-        services if the service splits into multiple services.
+        services if the service splits into multiple services. It is built on first access and the same
+        list is returned afterwards.
         """
-        return [cp for cpl in self._subsequent_calling_point_lists for cp in cpl.calling_points]
+        try:
+            return self._subsequent_calling_points
+        except AttributeError:
+            self._subsequent_calling_points = [cp for cpl in self.subsequent_calling_point_lists for cp in cpl.calling_points]
+            return self._subsequent_calling_points
 
-class CallingPoint(SoapResponseBase):
+class CallingPoint(TimedResponseBase):
     """A single calling point on a train route"""
     field_mapping = [
         ('location_name', 'locationName'),
@@ -535,6 +1668,35 @@ class CallingPoint(SoapResponseBase):
         ('st', 'st')
     ]
 
+    time_fields = [
+        ('scheduled_time', 'st', None),
+        ('estimated_time', 'et', 'st'),
+        ('actual_time', 'at', 'st'),
+    ]
+
+    __slots__ = _field_slots(field_mapping)
+
+    @property
+    def scheduled_time(self):
+        """
+        The scheduled time as a timezone-aware datetime, or None
+        """
+        return self._time('scheduled_time')
+
+    @property
+    def estimated_time(self):
+        """
+        The estimated time as a timezone-aware datetime, or None if it isn't a time
+        """
+        return self._time('estimated_time')
+
+    @property
+    def actual_time(self):
+        """
+        The actual time as a timezone-aware datetime, or None if it isn't a time
+        """
+        return self._time('actual_time')
+
     @property
     def location_name(self):
         """
@@ -584,18 +1746,24 @@ class CallingPointList(SoapResponseBase):
         ('association_is_cancelled', '_assocIsCancelled'),
     ]
 
-    def __init__(self, soap_data, *args, **kwargs):
+    nested_fields = [
+        ('calling_points', 'CallingPoint'),
+    ]
+
+    __slots__ = _field_slots(field_mapping) + ('_calling_points',)
+
+    def __init__(self, soap_data, time_anchor=None, *args, **kwargs):
         super(CallingPointList, self).__init__(soap_data, *args, **kwargs)
-        self._calling_points = self._calling_point_list(soap_data, 'callingPoint')
+        self._calling_points = self._calling_point_list(soap_data, 'callingPoint', time_anchor)
 
-    def _calling_point_list(self, soap_data, src_key):
+    def _calling_point_list(self, soap_data, src_key, time_anchor=None):
         try:
             calling_points = getattr(soap_data, src_key)
         except AttributeError:
             return []
         calling_points_list = []
         for point in calling_points:
-            calling_points_list.append(CallingPoint(point))
+            calling_points_list.append(CallingPoint(point, time_anchor=time_anchor))
         return calling_points_list
 
     @property
@@ -605,7 +1773,7 @@ class CallingPointList(SoapResponseBase):
 
         All the calling points contained within this calling point list
         """
-        return self._calling_points
+        return self._materialized('_calling_points')
 
     @property
     def service_type(self):
@@ -637,3 +1805,10 @@ class CallingPointList(SoapResponseBase):
 
 class WebServiceError(Exception):
     pass
+
+class QueryError(WebServiceError):
+    """
+    The webservice rejected a query as invalid, e.g. for an unknown CRS code or service ID. Making it again, or
+    more slowly, won't help
+    """
+    pass
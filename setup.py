@@ -11,9 +11,14 @@ setup(
     name='nre-darwin-py',
     version='0.1.3',
     packages=['nredarwin'],
+    package_data={'nredarwin': ['ldb-wsdl.xml']},
     install_requires=[
-        'suds-jurko'
+        'suds-jurko',
+        'futures; python_version < "3"',
     ],
+    extras_require={
+        'msgpack': ['msgpack'],
+    },
     include_package_data=True,
     license='BSD License',
     description='A simple python wrapper around National Rail Enquires LDBS SOAP Webservice',
@@ -0,0 +1,136 @@
+"""
+Tests of the asyncio support, kept apart from test_nredarwin because async def is a syntax error before Python 3.5.
+test_nredarwin loads them on Pythons which can run them
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+import nredarwin.asyncsession
+import nredarwin.pubsub
+import nredarwin.webservice
+from test_nredarwin import lite_response_from_file
+
+class StubSession(object):
+    """Stands in for DarwinLdbSession, recording calls instead of talking to Darwin"""
+
+    def __init__(self, delay=0, released=None):
+        self.delay = delay
+        self.released = released
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _record(self, call):
+        with self._lock:
+            self.calls.append(call)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        if self.released is not None:
+            self.released.wait(5)
+        with self._lock:
+            self.active -= 1
+        return call
+
+    def get_station_board(self, crs, **kwargs):
+        return self._record(('board', crs))
+
+    def get_service_details(self, service_id):
+        return self._record(('service', service_id))
+
+class AsyncSessionTest(unittest.TestCase):
+
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_results(self):
+        sesh = nredarwin.asyncsession.AsyncDarwinLdbSession(session=StubSession())
+        self.assertEqual(self.run_async(sesh.get_station_board('MAN')), ('board', 'MAN'))
+        self.assertEqual(self.run_async(sesh.get_service_details('abc')), ('service', 'abc'))
+        sesh.close()
+
+    def test_concurrency_limit(self):
+        stub = StubSession(delay=0.05)
+        sesh = nredarwin.asyncsession.AsyncDarwinLdbSession(session=stub, max_concurrency=3, call_timeout=5)
+        async def fetch_all():
+            return await asyncio.gather(*[sesh.get_station_board(crs) for crs in ['MAN', 'EUS', 'LDS', 'YRK', 'BHM', 'GLC']])
+        results = self.run_async(fetch_all())
+        self.assertEqual([r[1] for r in results], ['MAN', 'EUS', 'LDS', 'YRK', 'BHM', 'GLC'])
+        self.assertEqual(stub.max_active, 3)
+        sesh.close()
+
+    def test_waiting_for_a_slot_doesnt_time_out(self):
+        #far more coroutines than slots, each call well within call_timeout but the whole batch taking longer
+        stub = StubSession(delay=0.02)
+        sesh = nredarwin.asyncsession.AsyncDarwinLdbSession(session=stub, max_concurrency=5, call_timeout=0.3)
+        async def fetch_all():
+            return await asyncio.gather(*[sesh.get_station_board('S%03d' % i) for i in range(200)])
+        results = self.run_async(fetch_all())
+        self.assertEqual(len(results), 200)
+        self.assertEqual(stub.max_active, 5)
+        sesh.close()
+
+    def test_several_loops(self):
+        sesh = nredarwin.asyncsession.AsyncDarwinLdbSession(session=StubSession(), max_concurrency=2)
+        for crs in ('MAN', 'EUS'):
+            self.assertEqual(self.run_async(sesh.get_station_board(crs)), ('board', crs))
+        sesh.close()
+
+    def test_timeout(self):
+        released = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        sesh = nredarwin.asyncsession.AsyncDarwinLdbSession(session=StubSession(released=released), call_timeout=0.05, executor=executor)
+        loop = asyncio.new_event_loop()
+        try:
+            with self.assertRaises(nredarwin.webservice.WebServiceError):
+                loop.run_until_complete(sesh.get_station_board('MAN'))
+        finally:
+            #let the blocked call finish and report back before the loop it reports to is closed
+            released.set()
+            executor.shutdown(wait=True)
+            loop.close()
+
+class BoardStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.board = nredarwin.webservice.StationBoard(lite_response_from_file('departure-board.xml'))
+        test = self
+
+        class Session(nredarwin.webservice.DarwinLdbSession):
+            def __init__(self):
+                pass
+
+            def get_station_board(self, crs, **kwargs):
+                return test.board
+
+        self.publisher = nredarwin.pubsub.BoardPublisher(Session(), interval=0.01)
+
+    def tearDown(self):
+        self.publisher.close()
+
+    def test_async_stream(self):
+        async def first_update():
+            stream = nredarwin.asyncsession.BoardStream(self.publisher, 'MAN')
+            async for changes in stream:
+                stream.close()
+                return changes
+        #the stream uses the loop running it, not the thread's default loop
+        loop = asyncio.new_event_loop()
+        try:
+            changes = loop.run_until_complete(asyncio.wait_for(first_update(), 5))
+        finally:
+            loop.close()
+        self.assertTrue(changes.board is self.board)
+        self.assertEqual(self.publisher.feed_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()